@@ -1,36 +1,31 @@
 import os
-import json
-from openai import OpenAI
-import ijson
+from src.section_store import read_index, read_section
+from src.title_match import resolve_title
+from src.chunking import split_markdown, estimate_tokens, CHUNK_TOKENS
+from concurrent.futures import ThreadPoolExecutor
+from src.llm_cache import chat_completion
 
+# Bump this whenever the prompts below change, so the precompiled book artifacts are not reused.
+PROMPT_VERSION = "1"
 
-def load_experiments_json(json_path):
+
+def get_books_dir(dir_name):
     """
-    Load the whole json file of the experiment book.
+    Directory where the book is stored.
     """
-    with open(json_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), f"../books/{dir_name}"))
 
-def get_titles_from_json(json_path):
+def get_titles(dir_name):
     """
-    Efficiently extract all 'title' fields from the JSON file.
+    Get all the section titles of the book from the index of its section store.
     """
-    try:
-        titles = []
-        with open(json_path, "r", encoding="utf-8") as f:
-            for item in ijson.items(f, "item"):
-                if "title" in item:
-                    titles.append(item["title"])
-        return titles
-    except ImportError:
-        # Fallback to loading the whole file if ijson is not available
-        experiments = load_experiments_json(json_path)
-        return [item.get("title", "") for item in experiments if "title" in item]
+    return list(read_index(get_books_dir(dir_name), dir_name))
 
 def find_best_title_match(user_title, titles : str, chat_model, client):    
     """Find the title that best matches the query (user_title)."""
     query = user_title
-    response = client.chat.completions.create(
+    content = chat_completion(
+        client,
         model=chat_model,
         messages=[
             {"role": "system", "content": "你是一个可以从 python list 中找到与用户输入的实验题目最匹配的实验题目的有用助手。"},
@@ -38,57 +33,74 @@ def find_best_title_match(user_title, titles : str, chat_model, client):
         ],
         temperature=0.0
     )
-    return response.choices[0].message.content
+    return content
+
+def resolve_book_title(cfg, client):
+    """Resolve the user title to a section title of the book, asking the LLM only if the local match is ambiguous."""
+    titles = get_titles(cfg.dir_name)
+    return resolve_title(
+        cfg.dir_name,
+        cfg.title,
+        titles,
+        lambda user_title, titles: find_best_title_match(user_title, str(titles), cfg.chat_model, client),
+    )
 
 
-def get_text_by_title(cfg):
-    """Retrieve the 'text' corresponding to the user title."""
-    chat_model = cfg.chat_model
-    api_key = os.getenv("OPENAI_API_KEY")
-    base_url = os.getenv("OPENAI_BASE_URL")
-    dir_name = cfg.dir_name
-    chat_model = cfg.chat_model
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    json_path = os.path.abspath(os.path.join(os.path.dirname(__file__), f"../books/{dir_name}/{dir_name}.json"))
-    user_title = cfg.title
-    titles = get_titles_from_json(json_path)
-    title = find_best_title_match(user_title, str(titles), chat_model, client)
-    try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            for item in ijson.items(f, "item"):
-                if item.get("title", "").lower() == title.lower():
-                    return item.get("text", "")
-            # Fallback: try substring match
-            f.seek(0)
-            for item in ijson.items(f, "item"):
-                if title.lower() in item.get("title", "").lower():
-                    return item.get("text", "")
-        return ""
-    except ImportError:
-        # Fallback to loading the whole file if ijson is not available
-        experiments = load_experiments_json()
-        for item in experiments:
-            if item.get("title", "").lower() == title.lower():
-                return item.get("text", "")
-        for item in experiments:
-            if title.lower() in item.get("title", "").lower():
-                return item.get("text", "")
+def get_text_by_title(dir_name, title):
+    """Retrieve the 'text' corresponding to the resolved title."""
+    if not title:
         return ""
+    return read_section(get_books_dir(dir_name), dir_name, title)
+
+def extract_from_chunks(text, instruction, chat_model, client, max_tokens=CHUNK_TOKENS):
+    """
+    Map step for long sections: split the text on its headings and extract what `instruction` asks for
+    from every chunk concurrently. Short texts are returned as they are.
+    Each chunk is a separate cached request, so other reports on the same section reuse them.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    chunks = split_markdown(text, max_tokens)
+
+    def extract(chunk):
+        return chat_completion(
+            client,
+            model=chat_model,
+            messages=[
+                {"role": "system", "content": "你是一位善于概括与提取信息的有用助手。"},
+                {"role": "user", "content": (
+                    f"以下是实验指导书的一部分内容。{instruction}"
+                    "保留相关的公式（markdown 格式）与数据，尽量简洁；如果这部分没有相关内容，只输出“无”。\n"
+                    f"以下是实验指导书的内容：{chunk}。"
+                )},
+            ],
+            temperature=0.0
+        )
 
-def write_experiment_introduction(cfg):
+    with ThreadPoolExecutor(max_workers=min(len(chunks), 8)) as executor:
+        parts = list(executor.map(extract, chunks))
+    # The reduce step is the request that consumes the joined parts.
+    return "\n\n".join(part for part in parts if part.strip() not in ("无", "无。"))
+
+def extract_intro_material(text, chat_model, client):
+    """
+    The parts of the section needed by the introduction (the whole text for short sections).
+    """
+    return extract_from_chunks(
+        text,
+        "请提取其中与实验目的、实验原理（物理原理的解释及公式推导）、实验仪器及实验步骤有关的内容。",
+        chat_model,
+        client,
+    )
+
+def write_experiment_introduction(ctx):
     """Ask the LLM to write an experiment introduction using the provided text."""
-    chat_model = cfg.chat_model
-    api_key = os.getenv("OPENAI_API_KEY")
-    base_url = os.getenv("OPENAI_BASE_URL")
-    dir_name = cfg.dir_name
-    chat_model = cfg.chat_model
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    json_path = os.path.abspath(os.path.join(os.path.dirname(__file__), f"../books/{dir_name}/{dir_name}.json"))
-    user_title = cfg.title
-    titles = get_titles_from_json(json_path)
-    title = find_best_title_match(user_title, str(titles), chat_model, client)
-    text = get_text_by_title(cfg)
-    response = client.chat.completions.create(
+    chat_model = ctx.cfg.chat_model
+    client = ctx.client
+    title = ctx.title
+    text = ctx.intro_material
+    code = chat_completion(
+        client,
         model=chat_model,
         messages=[
             {"role": "system", "content": "你是一位会书写 LaTeX 实验报告的有用助手。"},
@@ -103,23 +115,22 @@ def write_experiment_introduction(cfg):
         ],
         temperature=0.1
     )
-    code = response.choices[0].message.content
-    output_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../tmp/output.txt"))
-    with open(output_path, "a", encoding="utf-8") as f:
-        f.write(code + "\n")
-    return response.choices[0].message.content
+    ctx.write_section("introduction", code)
+    return code
 
 
-def summarize_text(cfg):
+def summarize_text(text, chat_model, client):
     """
     Ask the LLM to summarize the provided text.
     """
-    chat_model = cfg.chat_model
-    api_key = os.getenv("OPENAI_API_KEY")
-    base_url = os.getenv("OPENAI_BASE_URL")
-    text = get_text_by_title(cfg)
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    response = client.chat.completions.create(
+    text = extract_from_chunks(
+        text,
+        "请提取其中在实验数据处理部分要完成的任务（要测量与计算的量、要绘制的图与表格）。",
+        chat_model,
+        client,
+    )
+    content = chat_completion(
+        client,
         model=chat_model,
         messages=[
             {"role": "system", "content": "你是一位善于概括与提取信息的有用助手。"},
@@ -130,5 +141,4 @@ def summarize_text(cfg):
         ],
         temperature=0.0
     )
-    return response.choices[0].message.content
-
+    return content
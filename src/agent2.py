@@ -1,26 +1,67 @@
-import os
+import time
 from src.tools import data_tool_factory
-from src.agent1 import summarize_text
-from langchain_openai import ChatOpenAI
-from langchain.agents import create_react_agent, AgentExecutor, tool
+from src.function_agent import run_function_agent
+from src.langchain_cache import LangChainDiskCache
+from src.clients import get_chat_model
+from src.scratchpad import compact_scratchpad
+from src.chunking import estimate_tokens
+from langchain.agents import AgentExecutor, tool
+from langchain.agents.output_parsers import ReActSingleInputOutputParser
 from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
 from langchain.schema import HumanMessage
+from langchain.tools.render import render_text_description
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnablePassthrough
+
+
+class IterationProgress(BaseCallbackHandler):
+    """
+    Report each action of the agent as one iteration of the "agent" stage,
+    and count the LLM calls and the tokens of their prompts.
+    """
+    def __init__(self, progress):
+        self.progress = progress
+        self.iterations = 0
+        self.llm_turns = 0
+        self.prompt_tokens = []
+
+    def on_agent_action(self, action, **kwargs):
+        self.iterations += 1
+        self.progress.update("agent", self.iterations, message=f"Agent used {action.tool}.")
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        # Chat models land here too, with their messages joined into one string.
+        tokens = sum(estimate_tokens(prompt) for prompt in prompts)
+        self.prompt_tokens.append(tokens)
+        print(f"Agent iteration {len(self.prompt_tokens)}: prompt of about {tokens} tokens.")
+
+    def on_llm_end(self, response, **kwargs):
+        self.llm_turns += 1
+
+TOOLS_PROMPT = """
+你需要完成一个物理实验的数据处理任务，全部完成后用`write_log`工具按实验顺序分部分记录实验处理中的重要信息。
+开始处理前，先用`data_accessor`输入 profile:all 一次性了解所有数据的结构、类型、单位与取值范围。
+需要拟合时，用`fit_series`在一次调用中拟合所有序列，它直接给出参数及其标准误差、R²和残差的统计（个数、均方根、最大绝对值），不必再用`data_processor`计算。
+互不依赖的工具调用（例如绘制多张图）请在同一次回复中同时发出。
+确保完成了全部内容，最后用`write_log`写记录，然后直接回复 Finish!，不再调用工具。
+"""
 
-def data_processing_agent(cfg):
+
+def data_processing_agent(ctx):
+    cfg = ctx.cfg
     CHAT_MODEL = cfg.chat_model
-    api_key = os.getenv("OPENAI_API_KEY")
-    base_url = os.getenv("OPENAI_BASE_URL")
 
-    chat_model = ChatOpenAI(
+    chat_model = get_chat_model(
+        CHAT_MODEL,
+        cfg.api_key,
+        cfg.base_url,
         temperature=0,
-        model_name=CHAT_MODEL,
-        base_url=base_url,
+        cache=LangChainDiskCache(),
     )
-    tools, data_saver, get_figures, get_log, plot_tables, write_latex = data_tool_factory(cfg)
+    tools, data_saver, get_figures, get_log, plot_tables, close_tools = data_tool_factory(cfg)
     
 
-    text = summarize_text(cfg)
+    text = ctx.task_summary
 #     text = """
 # # 实验数据处理
 # 给出你测量的弹簧的拉力和伸长量的数据表格，写明单位。
@@ -35,6 +76,8 @@ def data_processing_agent(cfg):
 {tools}
 
 你需要一步一步地思考，在处理过程中使用工具，确保完成了全部内容，最后用`write_log`写记录。
+开始处理前，先用`data_accessor`输入 profile:all 一次性了解所有数据的结构、类型、单位与取值范围。
+需要拟合时，用`fit_series`在一次调用中拟合所有序列，它直接给出参数及其标准误差、R²和残差的统计（个数、均方根、最大绝对值），不必再用`data_processor`计算。
 
 严格使用以下格式，不要用加粗或Markdown语法
 
@@ -60,35 +103,63 @@ Thought: {agent_scratchpad}
         input_variables=["input", "tools", "tool_names", "agent_scratchpad"],
         template=react_prompt,
     )
-    agent = create_react_agent(
-        llm=chat_model,
-        tools=tools,
-        prompt=prompt,
+    # `create_react_agent` with a scratchpad kept within a token budget instead of growing with every step.
+    agent = (
+        RunnablePassthrough.assign(agent_scratchpad=lambda x: compact_scratchpad(
+            x["intermediate_steps"],
+            max_tokens=cfg.scratchpad_tokens,
+            observation_tokens=cfg.observation_tokens,
+        ))
+        | prompt.partial(
+            tools=render_text_description(tools),
+            tool_names=", ".join(t.name for t in tools),
+        )
+        | chat_model.bind(stop=["\nObservation"])
+        | ReActSingleInputOutputParser()
     )
     agent_executor = AgentExecutor.from_agent_and_tools(
         agent=agent,
         tools=tools,
         verbose=True,
-        memory=ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-        ),
         max_iterations=50,
         handle_parsing_errors=True,
     )
 
-    agent_executor.invoke({
-        "input": text + "\n全部数据处理任务完成后，使用`write_log`工具记录信息\n" + cfg.prompt
-    })
+    task = text + "\n全部数据处理任务完成后，使用`write_log`工具记录信息\n" + cfg.prompt
+    try:
+        if cfg.agent_executor == "tools":
+            stats = run_function_agent(chat_model, tools, TOOLS_PROMPT, task, observation_tokens=cfg.observation_tokens, progress=cfg.progress)
+        else:
+            iteration_progress = IterationProgress(cfg.progress)
+            start = time.perf_counter()
+            agent_executor.invoke({"input": task}, config={"callbacks": [iteration_progress]})
+            stats = {
+                "executor": "react",
+                "llm_turns": iteration_progress.llm_turns,
+                "tool_calls": iteration_progress.iterations,
+                "seconds": round(time.perf_counter() - start, 2),
+                "prompt_tokens": sum(iteration_progress.prompt_tokens),
+                "max_prompt_tokens": max(iteration_progress.prompt_tokens, default=0),
+            }
+    finally:
+        # The dataframes are back in this process, the worker of the sandbox is no longer needed.
+        close_tools()
+    print(f"Agent stats: {stats}")
 
     data_saver()
 
     figures = get_figures()
     log = get_log()
     tables = plot_tables()
+    if cfg.table_backend == "latex":
+        table_note = "原始表格（已转换为 LaTeX 表格文件，用 \\input{路径} 直接插入，不要改写表格内容）"
+        table_paths = "原始数据表格 LaTeX 文件路径如下"
+    else:
+        table_note = "原始表格（已转换为图像，直接插入）"
+        table_paths = "原始数据表格图片路径如下"
 
     writer_prompt = f"""
-你是一个物理实验报告写作助手，需要根据实验要求和实验数据，按照 LaTeX 格式，写作实验报告的 实验数据处理 和 分析讨论 两部分。要求：包含文字说明、图像和原始表格（已转换为图像，直接插入），按照实验任务的顺序有条理的书写。
+你是一个物理实验报告写作助手，需要根据实验要求和实验数据，按照 LaTeX 格式，写作实验报告的 实验数据处理 和 分析讨论 两部分。要求：包含文字说明、图像和{table_note}，按照实验任务的顺序有条理的书写。
 
 数据处理部分的任务为：
 {text}
@@ -96,7 +167,7 @@ Thought: {agent_scratchpad}
 实验数据处理过程中的重要信息如下：
 {log}
 
-原始数据表格图片路径如下：
+{table_paths}：
 {tables}
 
 对表格名称的解释：{cfg.prompt}
@@ -114,4 +185,5 @@ Thought: {agent_scratchpad}
     messages = [HumanMessage(content=writer_prompt)]
     response = chat_model.invoke(messages)
     latex_code = response.content.strip()
-    write_latex(latex_code)
+    ctx.write_section("data_processing", latex_code)
+    return stats
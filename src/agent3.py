@@ -1,16 +1,16 @@
 import os
-import subprocess
-from openai import OpenAI
+import shutil
+from src.llm_cache import chat_completion, make_key
+from src.latex_build import compile_latex, LatexError
+from src.latex_assembler import build_report
 
 
-def get_compilable_latex(draft, chat_model, user_title):
+def get_compilable_latex(draft, chat_model, user_title, client):
     """
-    Integrate the sections in output.txt into a compilable LaTeX source code.
+    Integrate the section drafts into a compilable LaTeX source code.
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    base_url = os.getenv("OPENAI_BASE_URL")    
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    response = client.chat.completions.create(
+    content = chat_completion(
+        client,
         model=chat_model,
         messages=[
             {"role": "system", "content": "你是一位会书写 LaTeX 实验报告的有用助手。"},
@@ -18,36 +18,40 @@ def get_compilable_latex(draft, chat_model, user_title):
                 f"请将以下 LaTeX 草稿修正为可编译的完整LaTeX源代码：\n{draft}\n"
                 f"""要求：
                 1、只输出 LaTeX 源代码，不要输出其他影响编译的内容，也不要输出 latex```；
-                2、在geometry环境中设定margin=1in，并调用`amsmath`和`amssymb`以及其他必要的宏包；
+                2、在geometry环境中设定margin=1in，并调用`amsmath`、`amssymb`、`booktabs`、`longtable`、`float`以及其他必要的宏包；
                 3、确保图片在正确位置，使用`float`环境和`[H]`选项，所有图片单独一行，不要并列放置；
                 4、使用 ctexart 文档类；
                 5、实验报告题目为：{user_title}；
                 6、如果草稿中有markdown而非LaTeX的语法，请将其转换为LaTeX；
                 7、删除草稿中`（见 plot/figure_name.png）`这样注释性的语句；
-                8、确保代码可以编译成PDF。"""
+                8、保留草稿中插入表格的 `\\input{{...}}` 语句，不要展开或改写；
+                9、确保代码可以编译成PDF。"""
             )}
         ],
         temperature=0
     )
-    return response.choices[0].message.content
+    return content
 
 
-def write_final_report(cfg):
+def write_final_report(ctx):
     """
-    Write the final LaTeX report and compile it to PDF.
+    Assemble the final LaTeX report from the section drafts and compile it to PDF.
+    If it can't be made to compile fragment by fragment, the LLM rewrites the whole document.
     """
+    cfg = ctx.cfg
     chat_model = cfg.chat_model
     user_title = cfg.title
-    with open('tmp/output.txt', 'r', encoding='utf-8') as f:
-        draft_latex = f.read()
-    compilable_latex = get_compilable_latex(draft_latex, chat_model, user_title)
-    with open(f'{user_title}.tex', 'w', encoding='utf-8') as f:
-        f.write(compilable_latex)
-    compile_cmd = f"xelatex -output-directory=. {user_title}.tex"
-    subprocess.run(compile_cmd, shell=True, check=True)
-    subprocess.run(compile_cmd, shell=True, check=True)
-    os.makedirs('final_pdf', exist_ok=True)
-    move_cmd = f"mv {user_title}.pdf final_pdf/"
-    subprocess.run(move_cmd, shell=True, check=True)
-    clear = f"rm -f {user_title}.aux {user_title}.log"
-    subprocess.run(clear, shell=True, check=True)
+    # The report is written and compiled inside the workspace of the job.
+    tex_path = os.path.join(cfg.workspace, f"{user_title}.tex")
+    # Every job has a new workspace, so the .aux files of the last build of this report are kept per (book, title).
+    state_key = make_key(cfg.dir_name, user_title)
+    try:
+        pdf_path = build_report(ctx.section_drafts(), user_title, tex_path, cfg.build_dir, chat_model, ctx.client, progress=cfg.progress, state_key=state_key)
+    except LatexError as e:
+        print(f"The assembled report does not compile ({e}), rewriting the whole document.")
+        compilable_latex = get_compilable_latex(ctx.assemble_draft(), chat_model, user_title, ctx.client)
+        with open(tex_path, 'w', encoding='utf-8') as f:
+            f.write(compilable_latex)
+        pdf_path = compile_latex(tex_path, cfg.build_dir, progress=cfg.progress, state_key=state_key)
+    os.makedirs(cfg.output_dir, exist_ok=True)
+    shutil.move(pdf_path, os.path.join(cfg.output_dir, f"{user_title}.pdf"))
@@ -0,0 +1,25 @@
+import os
+import threading
+from contextlib import contextmanager
+
+
+def tmp_path_for(path):
+    """
+    Unique temporary name next to `path`, so concurrent writers of the same file never truncate each other's.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+@contextmanager
+def atomic_path(path):
+    """
+    Temporary path to write instead of `path`: moved onto `path` when the block succeeds, removed when it fails.
+    Readers see the old file or the new one, never a half written one.
+    """
+    tmp_path = tmp_path_for(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+EXECUTORS = ("react", "tools")
+# Marks the line of the output of a single run holding its statistics.
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+
+def run_once(executor, dir_name, title, chat_model, data_dir, prompt):
+    """
+    Run the data processing stage of one report with one executor, in this process, and return its statistics.
+    """
+    from src.config import CFG
+    from src.context import RunContext
+    from src.agent2 import data_processing_agent
+    cfg = CFG(
+        title=title,
+        dir_name=dir_name,
+        chat_model=chat_model,
+        vl_model="none",
+        prompt=prompt,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL"),
+        agent_executor=executor,
+    )
+    shutil.copytree(data_dir, cfg.data_dir)
+    try:
+        return data_processing_agent(RunContext(cfg))
+    finally:
+        shutil.rmtree(cfg.workspace, ignore_errors=True)
+
+def benchmark(dir_name, title, chat_model, data_dir, prompt, runs=1):
+    """
+    Run the data processing stage of one report with each agent executor and collect their statistics.
+    Every (run, executor) gets its own process and its own empty cache directory: no LLM answer,
+    figure or dataframe cached by another run can be replayed.
+    """
+    results = []
+    for run in range(runs):
+        for executor in EXECUTORS:
+            cache_dir = tempfile.mkdtemp(prefix="labotex-bench-")
+            try:
+                output = subprocess.run(
+                    [sys.executable, "-m", "src.benchmark_agents", "--run-once", executor, dir_name, title, chat_model, data_dir, prompt],
+                    env={**os.environ, "LABOTEX_CACHE_DIR": cache_dir},
+                    stdout=subprocess.PIPE,
+                    text=True,
+                    check=True,
+                ).stdout
+            finally:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            line = next(line for line in reversed(output.splitlines()) if line.startswith(RESULT_PREFIX))
+            results.append({"run": run + 1, **json.loads(line[len(RESULT_PREFIX):])})
+    return results
+
+
+if __name__ == "__main__":
+    # e.g. `python -m src.benchmark_agents book1 弹簧劲度系数测量 deepseek-v3 path/to/csv_dir "data.csv: 拉力与伸长量" 3`,
+    # with OPENAI_API_KEY and OPENAI_BASE_URL set.
+    if sys.argv[1] == "--run-once":
+        stats = run_once(*sys.argv[2:8])
+        print(RESULT_PREFIX + json.dumps(stats))
+        sys.exit(0)
+    dir_name, title, chat_model, data_dir, prompt = sys.argv[1:6]
+    runs = int(sys.argv[6]) if len(sys.argv) > 6 else 1
+    results = benchmark(dir_name, title, chat_model, data_dir, prompt, runs)
+    print(f"{'run':>4} {'executor':>9} {'LLM turns':>10} {'tool calls':>11} {'prompt tokens':>14} {'seconds':>9}")
+    for result in results:
+        print(f"{result['run']:>4} {result['executor']:>9} {result['llm_turns']:>10} {result['tool_calls']:>11} {result['prompt_tokens']:>14} {result['seconds']:>9}")
@@ -1,16 +1,48 @@
 import os
 import json
-from openai import OpenAI
-from pdf2image import convert_from_path
-import io
+import re
+from pdf2image import convert_from_path, pdfinfo_from_path
 import base64
+import hashlib
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from src.section_store import SectionWriter
+from src.clients import get_client
+from src.llm_cache import chat_completion
+from src.atomic import atomic_path
+
+# Bump this whenever the page prompts or their parsing change, so the cached page results are not reused.
+PROMPT_VERSION = "3"
+# Line between the json header of a page answer and its text, which is given as is, without json escaping.
+TEXT_DELIMITER = "===TEXT==="
+# LaTeX commands json would read as an escape (\b \f \n \r \t \u) when the model forgets to double their backslash.
+LATEX_ESCAPE_COMMANDS = (
+    "bar", "beta", "bf", "big", "bigg", "bigl", "bigr", "binom", "bm", "boldsymbol", "bot", "boxed", "bullet",
+    "fbox", "flat", "forall", "frac", "frown",
+    "nabla", "ne", "neg", "neq", "newline", "ni", "noindent", "nolimits", "nonumber", "not", "nu",
+    "rangle", "rceil", "rfloor", "rho", "right", "rightarrow", "rightleftharpoons", "rm",
+    "tan", "tanh", "tau", "text", "textbf", "textit", "textrm", "textstyle", "tfrac", "therefore", "theta",
+    "tilde", "times", "to", "top", "triangle", "triangleq",
+    "underbrace", "underline", "uparrow", "upsilon",
+)
+# A single backslash (after any number of escaped ones) starting one of these commands,
+# or starting a \u that is not followed by four hex digits.
+_latex_escape_re = re.compile(
+    r"(?<!\\)((?:\\\\)*)\\(?=(?:(?:%s)(?![a-zA-Z])|u(?![0-9a-fA-F]{4})))"
+    % "|".join(sorted(LATEX_ESCAPE_COMMANDS, key=len, reverse=True))
+)
+# Control characters no page text contains (tabs and line breaks aside), left behind by a LaTeX command decoded as a json escape.
+_control_re = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
 
 
 def judge_new_section(base64_image, vl_model_name, client):
     """
     judge whether the given image is a new section start page.
     """
-    response = client.chat.completions.create(
+    content = chat_completion(
+        client,
         model=vl_model_name,
         messages=[
             {"role": "system", "content": "你是一个能够判断这一页是否是新章节起始页的有用助手。"},
@@ -23,13 +55,14 @@ def judge_new_section(base64_image, vl_model_name, client):
             }
         ],
     )
-    return response.choices[0].message.content
+    return content
 
 def extract_title(base64_image, vl_model_name, client):
     """
     Used for the start page of a new section. Extract the title of the new section from the page.
     """
-    response = client.chat.completions.create(
+    content = chat_completion(
+        client,
         model=vl_model_name,
         messages=[
             {"role": "system", "content": "你是一个能够提取标题的有用助手。"},
@@ -42,72 +75,282 @@ def extract_title(base64_image, vl_model_name, client):
             }
         ],
     )
-    return response.choices[0].message.content
+    return content
+
+def ocr_page(base64_image, vl_model_name, client):
+    """
+    convert the given page image into text, keeping the formulas in markdown.
+    """
+    content = chat_completion(
+        client,
+        model=vl_model_name,
+        messages=[
+            {"role": "system", "content": "你是一个能够将图像转为文本得有用助手。"},
+            {
+                "role": "user", 
+                "content": [
+                    {"type": "text", "text": "将图像转化为文本，将数学公式保留为 markdown 格式，及 $...$ 。"},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                ]
+            }
+        ],
+    )
+    return content
+
+def encode_image(image_bytes):
+    """
+    Encode the JPEG bytes of a page into a base64 string.
+    """
+    return base64.b64encode(image_bytes).decode('utf-8')
+
+def iter_page_images(pdf_path, window_size=8, thread_count=1):
+    """
+    Rasterize the pdf `window_size` pages at a time and yield the JPEG bytes of each page in order.
+    The pages are written by pdftoppm into a temporary folder and removed once read,
+    so the whole book is never held in memory at once.
+    """
+    page_count = pdfinfo_from_path(pdf_path)["Pages"]
+    with tempfile.TemporaryDirectory() as output_folder:
+        for first_page in range(1, page_count + 1, window_size):
+            last_page = min(first_page + window_size - 1, page_count)
+            paths = convert_from_path(
+                pdf_path,
+                first_page=first_page,
+                last_page=last_page,
+                output_folder=output_folder,
+                fmt="jpeg",
+                paths_only=True,
+                thread_count=thread_count,
+            )
+            # Already in page order: with several threads the file names carry random prefixes, so never sort them.
+            for path in paths:
+                with open(path, "rb") as f:
+                    image_bytes = f.read()
+                os.remove(path)
+                yield image_bytes
+
+def analyze_page_combined(base64_image, vl_model_name, client):
+    """
+    Ask for the text, the new section judgement and the title of the page in one request.
+    Returns the raw answer of the model: a json header line, then `TEXT_DELIMITER`, then the text.
+    """
+    content = chat_completion(
+        client,
+        model=vl_model_name,
+        messages=[
+            {"role": "system", "content": "你是一个能够将图像转为文本，并判断这一页是否是新章节起始页的有用助手。"},
+            {
+                "role": "user", 
+                "content": [
+                    {"type": "text", "text": (
+                        "请完成以下三个任务：\n"
+                        "1、is_new_section：这一页是否是一个新章节的起始页，答案只能是 true 或 false。新章节的起始页一般包含标题，还可能有引言等内容；\n"
+                        "2、title：如果这一页是新章节的起始页，提取这一页的标题，一般是一个物理实验的名称，答案只能是一个字符串；否则为 null；\n"
+                        "3、text：将图像转化为文本，将数学公式保留为 markdown 格式，及 $...$ 。\n"
+                        f"输出格式：第一行是 json 格式的 is_new_section 和 title，第二行是 {TEXT_DELIMITER}，之后原样输出 text，"
+                        "text 不需要任何转义，不要输出其他内容。例如：\n"
+                        f'{{"is_new_section": true, "title": "..."}}\n{TEXT_DELIMITER}\n...'
+                    )},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                ]
+            }
+        ],
+    )
+    return content
+
+def _loads_json_answer(answer):
+    """
+    Decode a json answer, repairing the backslashes of LaTeX commands only when it is not valid json as it is,
+    or when its text came out with control characters (`\\frac` read as a form feed). None if it can't be decoded.
+    """
+    try:
+        result = json.loads(answer)
+        if not (isinstance(result, dict) and isinstance(result.get("text"), str) and _control_re.search(result["text"])):
+            return result
+    except json.JSONDecodeError:
+        pass
+    # `\frac` or `\beta` are valid json escapes followed by text: double their backslash before decoding.
+    answer = _latex_escape_re.sub(lambda m: m.group(1) + r"\\", answer)
+    try:
+        return json.loads(answer)
+    except json.JSONDecodeError:
+        pass
+    # Backslashes of LaTeX commands that were not escaped, e.g. `\sigma`.
+    try:
+        return json.loads(re.sub(r'(\\["\\/bfnrtu])|\\', lambda m: m.group(1) or r'\\', answer))
+    except json.JSONDecodeError:
+        return None
+
+def parse_page_analysis(answer):
+    """
+    Parse and validate the answer of `analyze_page_combined`. A plain json object with the text in it is accepted too.
+    Returns the page result dict, or None if the answer is not a valid result.
+    """
+    answer = answer.strip()
+    # Remove the ```json ... ``` fence the models like to add.
+    if answer.startswith("```"):
+        answer = answer.split("\n", 1)[-1]
+        answer = answer.rsplit("```", 1)[0]
+    header, delimiter, text = answer.partition(f"\n{TEXT_DELIMITER}")
+    result = _loads_json_answer(header)
+    if delimiter and isinstance(result, dict):
+        # The text after the delimiter is raw: none of its backslashes is an escape.
+        result["text"] = text.split("\n", 1)[1].strip() if "\n" in text else ""
+    if not isinstance(result, dict):
+        return None
+    text = result.get("text")
+    is_new_section = result.get("is_new_section")
+    title = result.get("title")
+    if isinstance(is_new_section, str) and is_new_section.strip().lower() in ("true", "false"):
+        is_new_section = is_new_section.strip().lower() == "true"
+    if not isinstance(text, str) or not isinstance(is_new_section, bool):
+        return None
+    # Another LaTeX command decoded as an escape: better ask again than keep a corrupted text.
+    if _control_re.search(text):
+        return None
+    if is_new_section:
+        if not isinstance(title, str) or not title.strip():
+            return None
+        title = title.strip()
+    else:
+        title = None
+    return {"text": text, "is_new_section": is_new_section, "title": title}
+
+def page_cache_key(image_bytes, vl_model_name):
+    """
+    Key of a page in the page cache: hash of the page image, the model name and the prompt version.
+    """
+    digest = hashlib.sha256(image_bytes)
+    digest.update(f"\0{vl_model_name}\0{PROMPT_VERSION}".encode("utf-8"))
+    return digest.hexdigest()
+
+def load_cached_page(cache_dir, key):
+    """
+    Return the cached result of a page, or None if the page was not processed yet.
+    """
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        # A broken entry is simply processed again.
+        return None
+
+def save_cached_page(cache_dir, key, result):
+    """
+    Write the result of a page into the page cache.
+    The entry is written to a temporary file first, so a crash never leaves a half written entry.
+    """
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+    with atomic_path(cache_path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+
+def analyze_page(image_bytes, vl_model_name, client, combined=True, cache_dir=None):
+    """
+    Run all the VLM calls needed for one page.
+    Returns a dict with the page text, whether it starts a new section and its title (None if not a section start).
+    With `combined`, the page is uploaded once and the separate calls are only used when the answer can't be parsed.
+    With `cache_dir`, pages that were already processed are read from the page cache instead.
+    """
+    if cache_dir is not None:
+        key = page_cache_key(image_bytes, vl_model_name)
+        result = load_cached_page(cache_dir, key)
+        if result is not None:
+            return result
+    base64_image = encode_image(image_bytes)
+    result = None
+    if combined:
+        result = parse_page_analysis(analyze_page_combined(base64_image, vl_model_name, client))
+    if result is None:
+        text = ocr_page(base64_image, vl_model_name, client)
+        is_new_section = judge_new_section(base64_image, vl_model_name, client) == "True"
+        title = extract_title(base64_image, vl_model_name, client) if is_new_section else None
+        result = {"text": text, "is_new_section": is_new_section, "title": title}
+    if cache_dir is not None:
+        save_cached_page(cache_dir, key, result)
+    return result
+
+def analyze_pages(images, vl_model_name, client, max_workers=1, combined=True, cache_dir=None):
+    """
+    Analyze the pages, with at most `max_workers` pages in flight at the same time.
+    `images` is consumed lazily, so only the pages in flight are held in memory.
+    The results are yielded in page order whatever the order the requests finish in.
+    """
+    if max_workers <= 1:
+        for image_bytes in images:
+            yield analyze_page(image_bytes, vl_model_name, client, combined, cache_dir)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for image_bytes in images:
+            pending.append(executor.submit(analyze_page, image_bytes, vl_model_name, client, combined, cache_dir))
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def report_pages(page_results, progress, page_count):
+    """
+    Pass the page results through, reporting how many pages are done.
+    """
+    for i, page in enumerate(page_results, start=1):
+        progress.update("ocr", i, page_count)
+        yield page
+
+def write_sections(page_results, writer):
+    """
+    Split the ordered page results into sections and append them to the section store.
+    """
+    # Used to record the title and content fields of the section.
+    title = None
+    content = ""
+    for page in page_results:
+        text = page["text"]
+        if page["is_new_section"]:
+            if title is not None:
+                writer.append(title, content)
+            title = page["title"]
+            content = text
+        else:
+            content += text
+    # The last section ends with the book.
+    if title is not None:
+        writer.append(title, content)
 
 def pdf_to_json(cfg):
     """
-    load the experiment book pdf into json file.
+    load the experiment book pdf into the section store of the book.
     """
     # first load the config from the cfg object.
     dir_name = cfg.dir_name
     vl_model_name = cfg.vl_model
-    api_key = os.getenv("OPENAI_API_KEY")
-    base_url = os.getenv("OPENAI_BASE_URL")
+    max_workers = cfg.ocr_workers
+    window_size = cfg.raster_window
+    combined = cfg.combined_analysis
     books_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), f"../books/{dir_name}"))
     pdf_filename = next((f for f in os.listdir(books_dir) if f.lower().endswith(".pdf")), None)
     if not pdf_filename:
         raise FileNotFoundError(f"No PDF file found in {books_dir}")
     pdf_path = os.path.join(books_dir, pdf_filename)
     json_path = os.path.join(books_dir, f"{dir_name}.json")
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    # Remove the existing json.
+    # Results of the pages already processed, so a rerun only pays for the new or changed pages.
+    cache_dir = os.path.join(books_dir, "page_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    client = get_client(cfg.api_key, cfg.base_url)
+    # Extract text from each page of the PDF file, several pages at a time.
+    page_count = pdfinfo_from_path(pdf_path)["Pages"]
+    images = iter_page_images(pdf_path, window_size, thread_count=min(max_workers, window_size))
+    page_results = analyze_pages(images, vl_model_name, client, max_workers, combined, cache_dir)
+    page_results = report_pages(page_results, cfg.progress, page_count)
+    with SectionWriter(books_dir, dir_name) as writer:
+        write_sections(page_results, writer)
+    # Remove the json of a former ingestion, the book is now kept in the section store.
     if os.path.exists(json_path):
         os.remove(json_path)
-    # Used to record the title and content fields of the json file.
-    title = None
-    content = ""
-    # Extract text from each page of the PDF file.
-    images = convert_from_path(pdf_path)
-    for i, image in enumerate(images):
-        # Encode image directly from memory
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
-        base64_image = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        response = client.chat.completions.create(
-            model=vl_model_name,
-            messages=[
-                {"role": "system", "content": "你是一个能够将图像转为文本得有用助手。"},
-                {
-                    "role": "user", 
-                    "content": [
-                        {"type": "text", "text": "将图像转化为文本，将数学公式保留为 markdown 格式，及 $...$ 。"},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                    ]
-                }
-            ],
-        )
-        text = response.choices[0].message.content
-
-        if judge_new_section(base64_image, vl_model_name, client) == "True":            
-            if os.path.exists(json_path):
-                with open(json_path, "r") as jf:
-                    data = json.load(jf)
-            else:
-                data = []
-            if title == None:
-                title = extract_title(base64_image, vl_model_name, client)
-                content = text
-            else:
-                data.append({"title": title, "text": content})
-                with open(json_path, "w") as jf:
-                    json.dump(data, jf, ensure_ascii=False, indent=2)
-                title = extract_title(base64_image, vl_model_name, client)
-                content = text
-        else:
-            content += text
-
-        
-
-
-
-
+    # The precompiled artifacts were derived from the former sections.
+    artifacts_dir = os.path.join(books_dir, "artifacts")
+    if os.path.isdir(artifacts_dir):
+        shutil.rmtree(artifacts_dir)
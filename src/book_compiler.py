@@ -0,0 +1,74 @@
+import os
+import re
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+from src.agent1 import get_books_dir, summarize_text, extract_intro_material, PROMPT_VERSION
+from src.section_store import read_index, read_section
+from src.clients import get_client
+from src.atomic import atomic_path
+
+
+def artifacts_path(dir_name, chat_model):
+    """
+    Where the artifacts of a book are stored, next to its section store, one file per (model, prompt version).
+    """
+    model_name = re.sub(r"[^\w.-]+", "_", chat_model)
+    return os.path.join(get_books_dir(dir_name), "artifacts", f"{model_name}-v{PROMPT_VERSION}.json")
+
+def load_artifacts(dir_name, chat_model):
+    """
+    The precompiled artifacts of the book by section title, or {} if the book was not compiled for this model.
+    """
+    path = artifacts_path(dir_name, chat_model)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def compile_section(text, chat_model, client):
+    """
+    The book-derived results every report on this section needs.
+    """
+    intro_material = extract_intro_material(text, chat_model, client)
+    return {
+        "task_summary": summarize_text(text, chat_model, client),
+        # Short sections are used as they are, no need to store them twice.
+        "intro_material": intro_material if intro_material != text else None,
+    }
+
+def compile_book(cfg, max_workers=4):
+    """
+    Precompute the artifacts of every section of the book for `cfg.chat_model`, several sections at a time.
+    """
+    dir_name = cfg.dir_name
+    chat_model = cfg.chat_model
+    progress = cfg.progress
+    client = get_client(cfg.api_key, cfg.base_url)
+    books_dir = get_books_dir(dir_name)
+    index = read_index(books_dir, dir_name)
+    titles = list(index)
+
+    def compile_title(title):
+        return compile_section(read_section(books_dir, dir_name, title, index), chat_model, client)
+
+    artifacts = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i, (title, result) in enumerate(zip(titles, executor.map(compile_title, titles)), start=1):
+            artifacts[title] = result
+            progress.update("compile_book", i, len(titles))
+    path = artifacts_path(dir_name, chat_model)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Concurrent compilations of the same book each write their own temporary file.
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(artifacts, f, ensure_ascii=False, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    # e.g. `python -m src.book_compiler book1 deepseek-v3`, with OPENAI_API_KEY and OPENAI_BASE_URL set.
+    from src.config import CFG
+    dir_name, chat_model = sys.argv[1], sys.argv[2]
+    cfg = CFG(title="none", dir_name=dir_name, chat_model=chat_model, vl_model="none", prompt="none")
+    print(f"Artifacts written to {compile_book(cfg)}.")
@@ -0,0 +1,70 @@
+import re
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # Without tiktoken, the number of tokens is estimated from the characters.
+    _encoding = None
+
+# Sections longer than this are split before being sent to the LLM.
+CHUNK_TOKENS = 4000
+
+
+def estimate_tokens(text):
+    """
+    Number of tokens of the text: exact with tiktoken, otherwise about one token
+    per CJK character and one token per four other characters.
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    cjk = len(re.findall(r"[　-鿿豈-﫿＀-￯]", text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _split_block(block, max_tokens):
+    """
+    Split a block that is too long on its paragraphs, and on its lines if a paragraph is still too long.
+    """
+    for separator in ("\n\n", "\n"):
+        parts = block.split(separator)
+        if len(parts) > 1:
+            chunks, current = [], ""
+            for part in parts:
+                candidate = f"{current}{separator}{part}" if current else part
+                if current and estimate_tokens(candidate) > max_tokens:
+                    chunks.append(current)
+                    current = part
+                else:
+                    current = candidate
+            if current:
+                chunks.append(current)
+            if all(estimate_tokens(chunk) <= max_tokens for chunk in chunks):
+                return chunks
+            return [piece for chunk in chunks for piece in _split_block(chunk, max_tokens)]
+    # A single huge line: cut it by characters.
+    size = max(1, len(block) * max_tokens // max(estimate_tokens(block), 1))
+    return [block[i:i + size] for i in range(0, len(block), size)]
+
+def split_markdown(text, max_tokens=CHUNK_TOKENS):
+    """
+    Split a section on its markdown headings into chunks of at most `max_tokens` tokens.
+    Consecutive small parts are merged, so a chunk holds as many whole subsections as possible.
+    """
+    blocks = [block for block in re.split(r"\n(?=#{1,6}\s)", text) if block.strip()]
+    chunks, current = [], ""
+    for block in blocks:
+        if estimate_tokens(block) > max_tokens:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_split_block(block, max_tokens))
+            continue
+        candidate = f"{current}\n{block}" if current else block
+        if current and estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            current = block
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,52 @@
+import threading
+from openai import OpenAI, DefaultHttpxClient
+import httpx
+
+# Connections kept alive per (api_key, base_url), shared by the threads of all the runs.
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+
+_http_clients = {}
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_http_client(api_key, base_url):
+    """
+    The pooled keep-alive HTTP client for one (api_key, base_url) pair.
+    """
+    key = (api_key, base_url)
+    with _lock:
+        if key not in _http_clients:
+            _http_clients[key] = DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                )
+            )
+        return _http_clients[key]
+
+def get_client(api_key, base_url):
+    """
+    The OpenAI client for one (api_key, base_url) pair, created once and reused.
+    Credentials are passed explicitly, so users with different keys can run at the same time.
+    """
+    key = (api_key, base_url)
+    http_client = get_http_client(api_key, base_url)
+    with _lock:
+        if key not in _clients:
+            _clients[key] = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+        return _clients[key]
+
+def get_chat_model(model_name, api_key, base_url, **kwargs):
+    """
+    A `ChatOpenAI` model sharing the connection pool of `get_client`.
+    """
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model_name=model_name,
+        api_key=api_key,
+        base_url=base_url,
+        http_client=get_http_client(api_key, base_url),
+        **kwargs,
+    )
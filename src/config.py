@@ -0,0 +1,61 @@
+import os
+import uuid
+from src.progress import Progress
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+JOBS_DIR = os.path.join(ROOT_DIR, "jobs")
+# Defaults of the report settings, set for the whole server through the environment,
+# e.g. `LABOTEX_AGENT_EXECUTOR=tools python -m src.main`.
+SANDBOX = os.getenv("LABOTEX_SANDBOX", "1") != "0"
+SANDBOX_TIMEOUT = int(os.getenv("LABOTEX_SANDBOX_TIMEOUT", "60"))
+SANDBOX_MEMORY_MB = int(os.getenv("LABOTEX_SANDBOX_MEMORY_MB", "2048"))
+TABLE_BACKEND = os.getenv("LABOTEX_TABLE_BACKEND", "latex")
+FIGURE_FORMAT = os.getenv("LABOTEX_FIGURE_FORMAT", "pdf")
+AGENT_EXECUTOR = os.getenv("LABOTEX_AGENT_EXECUTOR", "react")
+
+
+class CFG:
+    def __init__(self, title, dir_name, chat_model, vl_model, prompt, api_key=None, base_url=None, ocr_workers=1, combined_analysis=True, raster_window=8, sandbox=SANDBOX, sandbox_timeout=SANDBOX_TIMEOUT, sandbox_memory_mb=SANDBOX_MEMORY_MB, table_backend=TABLE_BACKEND, table_digits=4, figure_format=FIGURE_FORMAT, agent_executor=AGENT_EXECUTOR, scratchpad_tokens=6000, observation_tokens=800, workspace=None, progress=None):
+        self.title = title
+        self.dir_name = dir_name
+        self.chat_model = chat_model
+        self.vl_model = vl_model
+        self.prompt = prompt
+        # Credentials are carried by the config of each run rather than by the process environment.
+        self.api_key = api_key
+        self.base_url = base_url
+        self.ocr_workers = ocr_workers
+        self.combined_analysis = combined_analysis
+        self.raster_window = raster_window
+        # `data_processor` queries run in a worker process, stopped after `sandbox_timeout` seconds
+        # or when they use more than `sandbox_memory_mb` of memory.
+        self.sandbox = sandbox
+        self.sandbox_timeout = sandbox_timeout
+        self.sandbox_memory_mb = sandbox_memory_mb
+        # "latex": data tables are written as LaTeX tables (`table_digits` significant digits),
+        # "image": they are rendered as PNG images.
+        self.table_backend = table_backend
+        self.table_digits = table_digits
+        # Format of the figures: "pdf" (vector, embedded as is by xelatex) or "png".
+        self.figure_format = figure_format
+        # Executor of the data processing agent: "react" (text Thought/Action loop) or
+        # "tools" (native tool calling, several tool calls per turn).
+        self.agent_executor = agent_executor
+        for name, value, allowed in (
+            ("table_backend", table_backend, ("latex", "image")),
+            ("figure_format", figure_format, ("pdf", "png")),
+            ("agent_executor", agent_executor, ("react", "tools")),
+        ):
+            if value not in allowed:
+                raise ValueError(f"Unknown {name} {value!r}, use one of {allowed}.")
+        # Token budgets of the agent: the whole scratchpad resent at every iteration, and each tool output in it.
+        self.scratchpad_tokens = scratchpad_tokens
+        self.observation_tokens = observation_tokens
+        # Every job works in its own directory, so concurrent jobs never touch each other's files.
+        self.workspace = workspace or os.path.join(JOBS_DIR, uuid.uuid4().hex)
+        self.data_dir = os.path.join(self.workspace, "data")
+        self.plots_dir = os.path.join(self.workspace, "plots")
+        self.output_dir = os.path.join(self.workspace, "final_pdf")
+        self.build_dir = os.path.join(self.workspace, "build")
+        # Where the stages report their progress, e.g. the background job running them.
+        self.progress = progress or Progress()
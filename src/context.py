@@ -0,0 +1,78 @@
+import threading
+from src.clients import get_client
+from src.agent1 import resolve_book_title, get_text_by_title, summarize_text, extract_intro_material
+from src.book_compiler import load_artifacts
+
+# Order of the section drafts in the report, whatever order the stages finish in.
+SECTION_ORDER = ["introduction", "data_processing"]
+
+
+class RunContext:
+    """
+    State shared by the agents during one report run.
+    Each value is computed the first time it is needed and then reused for the rest of the run.
+    """
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self._values = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self.sections = {}
+
+    def _get(self, name, compute):
+        # One lock per value, so computing one value never blocks readers of another.
+        with self._locks_lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._values:
+                self._values[name] = compute()
+            return self._values[name]
+
+    @property
+    def client(self):
+        return self._get("client", lambda: get_client(self.cfg.api_key, self.cfg.base_url))
+
+    @property
+    def title(self):
+        """Section title of the book matching the title of the report."""
+        return self._get("title", lambda: resolve_book_title(self.cfg, self.client))
+
+    @property
+    def text(self):
+        """Text of the section of the book."""
+        return self._get("text", lambda: get_text_by_title(self.cfg.dir_name, self.title))
+
+    @property
+    def artifacts(self):
+        """Artifacts of the section precompiled at book ingestion, {} if the book was not compiled for this model."""
+        return self._get("artifacts", lambda: load_artifacts(self.cfg.dir_name, self.cfg.chat_model).get(self.title, {}))
+
+    @property
+    def task_summary(self):
+        """Data processing tasks extracted from the section."""
+        return self._get("task_summary", lambda: (
+            self.artifacts.get("task_summary")
+            or summarize_text(self.text, self.cfg.chat_model, self.client)
+        ))
+
+    @property
+    def intro_material(self):
+        """Parts of the section the introduction is written from."""
+        return self._get("intro_material", lambda: (
+            self.artifacts.get("intro_material")
+            or (self.text if "task_summary" in self.artifacts else extract_intro_material(self.text, self.cfg.chat_model, self.client))
+        ))
+
+    def write_section(self, name, code):
+        """Store the LaTeX draft of one part of the report."""
+        with self._locks_lock:
+            self.sections[name] = code
+
+    def section_drafts(self):
+        """The section drafts in report order."""
+        with self._locks_lock:
+            return [self.sections[name] for name in SECTION_ORDER if name in self.sections]
+
+    def assemble_draft(self):
+        """Concatenate the section drafts in report order."""
+        return "\n".join(self.section_drafts())
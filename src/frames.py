@@ -0,0 +1,113 @@
+import os
+import hashlib
+import threading
+from collections.abc import MutableMapping
+import pandas as pd
+from src.llm_cache import CACHE_ROOT
+from src.atomic import atomic_path
+
+try:
+    import pyarrow
+    HAS_PYARROW = True
+except ImportError:
+    # Without pyarrow there is no columnar format to cache into, the CSV files are parsed every time.
+    HAS_PYARROW = False
+
+FRAMES_CACHE_DIR = os.path.join(CACHE_ROOT, "frames")
+# CSV files larger than this are parsed chunk by chunk, each chunk being downcast before the next one is read.
+CHUNK_BYTES = 64 * 1024 * 1024
+CHUNK_ROWS = 200_000
+
+
+def file_hash(path):
+    """
+    sha256 of the content of a file, read block by block.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def downcast(df):
+    """
+    Store integer columns in the smallest integer type that holds them.
+    Float columns keep float64: measured values must not lose precision.
+    """
+    for column in df.select_dtypes(include="integer").columns:
+        df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
+
+def read_csv(path):
+    """
+    Parse a CSV file, in chunks for large data-logger exports so the object buffers of the parser stay small.
+    """
+    if os.path.getsize(path) <= CHUNK_BYTES:
+        return downcast(pd.read_csv(path))
+    chunks = [downcast(chunk) for chunk in pd.read_csv(path, chunksize=CHUNK_ROWS)]
+    return downcast(pd.concat(chunks, ignore_index=True))
+
+def load_csv(path, cache_dir=FRAMES_CACHE_DIR):
+    """
+    Load a CSV file through the columnar cache: files already parsed once (same content) are read back from Parquet.
+    """
+    if not HAS_PYARROW:
+        return read_csv(path)
+    cache_path = os.path.join(cache_dir, f"{file_hash(path)}.parquet")
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception:
+            # A broken entry is simply parsed again.
+            pass
+    df = read_csv(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with atomic_path(cache_path) as tmp_path:
+            df.to_parquet(tmp_path, index=False)
+    except Exception as e:
+        # Columns Parquet can't hold (e.g. mixed objects) only cost the cache.
+        print(f"Could not cache {path}: {e}")
+    return df
+
+
+class LazyFrames(MutableMapping):
+    """
+    The `dfs` dictionary of the data tools: each CSV file is only loaded the first time its dataframe is used.
+    Dataframes created by the agent are stored like in a plain dict.
+    """
+    def __init__(self, paths):
+        self.paths = dict(paths)
+        self.frames = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self.frames:
+                if name not in self.paths:
+                    raise KeyError(name)
+                self.frames[name] = load_csv(self.paths[name])
+            return self.frames[name]
+
+    def __setitem__(self, name, df):
+        with self._lock:
+            self.frames[name] = df
+
+    def __delitem__(self, name):
+        with self._lock:
+            if name not in self.frames and name not in self.paths:
+                raise KeyError(name)
+            self.frames.pop(name, None)
+            self.paths.pop(name, None)
+
+    def __iter__(self):
+        return iter(list(self.paths) + [name for name in self.frames if name not in self.paths])
+
+    def __len__(self):
+        return len(set(self.paths) | set(self.frames))
+
+    def __contains__(self, name):
+        return name in self.paths or name in self.frames
+
+    def is_loaded(self, name):
+        return name in self.frames
@@ -0,0 +1,81 @@
+import time
+import json
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
+from src.progress import Progress
+from src.chunking import estimate_tokens
+from src.scratchpad import truncate_text, OBSERVATION_TOKENS
+
+# Tools that change the state the other tools read (the dataframes, the log) run alone, in the order they were called.
+SEQUENTIAL_TOOLS = ("data_processor", "write_log")
+
+
+def _run_call(tools_by_name, call):
+    tool = tools_by_name.get(call["name"])
+    if tool is None:
+        return f"Unknown tool {call['name']}. Available tools are: {list(tools_by_name)}."
+    try:
+        return str(tool.invoke(call["args"]))
+    except Exception as e:
+        return f"Exception occurs: {str(e)}"
+
+def run_tool_calls(tools_by_name, calls, executor, sequential=SEQUENTIAL_TOOLS):
+    """
+    Run the tool calls of one model turn and return their outputs in the order of the calls.
+    Consecutive calls of independent tools run concurrently, a call of a `sequential` tool waits for
+    all the calls before it and runs alone.
+    """
+    outputs = [None] * len(calls)
+    batch = []
+
+    def flush():
+        for i, output in zip(batch, executor.map(lambda i: _run_call(tools_by_name, calls[i]), batch)):
+            outputs[i] = output
+        batch.clear()
+
+    for i, call in enumerate(calls):
+        if call["name"] in sequential:
+            flush()
+            outputs[i] = _run_call(tools_by_name, call)
+        else:
+            batch.append(i)
+    flush()
+    return outputs
+
+def run_function_agent(chat_model, tools, system_prompt, task, max_turns=30, max_workers=4, observation_tokens=OBSERVATION_TOKENS, progress=None):
+    """
+    Agent loop on the native tool calling API of the chat model: each turn the model may call several tools,
+    which run concurrently, until it answers without calling any. Tool outputs are truncated to `observation_tokens`.
+    Returns the statistics of the run: LLM turns, tool calls, prompt tokens and wall-clock seconds.
+    """
+    progress = progress or Progress()
+    tools_by_name = {tool.name: tool for tool in tools}
+    model = chat_model.bind_tools(tools)
+    messages = [SystemMessage(content=system_prompt), HumanMessage(content=task)]
+    stats = {"executor": "tools", "llm_turns": 0, "tool_calls": 0, "seconds": 0.0, "prompt_tokens": 0, "max_prompt_tokens": 0}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for turn in range(1, max_turns + 1):
+            tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+            stats["prompt_tokens"] += tokens
+            stats["max_prompt_tokens"] = max(stats["max_prompt_tokens"], tokens)
+            print(f"Agent turn {turn}: prompt of about {tokens} tokens.")
+            response = model.invoke(messages)
+            stats["llm_turns"] = turn
+            messages.append(response)
+            calls = response.tool_calls
+            if not calls:
+                break
+            stats["tool_calls"] += len(calls)
+            progress.update("agent", turn, message=f"Agent used {', '.join(call['name'] for call in calls)}.")
+            for call in calls:
+                print(f"Tool call: {call['name']} {json.dumps(call['args'], ensure_ascii=False)}")
+            outputs = run_tool_calls(tools_by_name, calls, executor)
+            messages.extend(
+                ToolMessage(content=truncate_text(output, observation_tokens), tool_call_id=call["id"])
+                for call, output in zip(calls, outputs)
+            )
+        else:
+            print(f"Agent stopped after {max_turns} turns.")
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from src.config import JOBS_DIR
+from src.progress import Progress
+
+
+class Job(Progress):
+    """
+    One background job: its state, the progress of each of its stages and its result.
+    """
+    def __init__(self, job_id, kind):
+        self.id = job_id
+        self.kind = kind
+        self.state = "queued"
+        self.stages = {}
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def update(self, stage, done=None, total=None, message=None):
+        with self._lock:
+            progress = self.stages.setdefault(stage, {"done": None, "total": None})
+            if done is not None:
+                progress["done"] = done
+            if total is not None:
+                progress["total"] = total
+            if message is not None:
+                self.message = message
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "state": self.state,
+                "stages": {stage: dict(progress) for stage, progress in self.stages.items()},
+                "message": self.message,
+                "error": self.error,
+                "elapsed": (self.finished or time.time()) - (self.started or self.created),
+            }
+
+
+class JobQueue:
+    """
+    Runs jobs in the background on a bounded worker pool, so the web handlers only submit and poll.
+    """
+    def __init__(self, max_workers):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args):
+        """
+        Queue `fn(job, *args)` and return the id of the job right away.
+        The job id is also the name of the workspace of the job under `jobs/`.
+        """
+        job = Job(uuid.uuid4().hex, kind)
+        with self._lock:
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, fn, args)
+        return job.id
+
+    def _run(self, job, fn, args):
+        with job._lock:
+            job.state = "running"
+            job.started = time.time()
+        try:
+            result = fn(job, *args)
+            with job._lock:
+                job.result = result
+                job.state = "done"
+        except Exception as e:
+            traceback.print_exc()
+            with job._lock:
+                job.error = str(e)
+                job.state = "failed"
+        finally:
+            with job._lock:
+                job.finished = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def status(self, job_id):
+        """
+        State and per-stage progress of a job, or None if the job is unknown.
+        """
+        job = self.get(job_id)
+        return job.snapshot() if job is not None else None
+
+    def artifacts(self, job_id):
+        """
+        Files produced by a report job. They stay on disk, so they can be fetched after a restart too.
+        """
+        output_dir = os.path.join(JOBS_DIR, os.path.basename(job_id), "final_pdf")
+        if not os.path.isdir(output_dir):
+            return []
+        return [os.path.join(output_dir, name) for name in sorted(os.listdir(output_dir))]
+
+
+def format_status(status):
+    """
+    Human readable summary of a job status for the web interface.
+    """
+    if status is None:
+        return "Unknown job."
+    lines = [f"Job {status['id']} ({status['kind']}): {status['state']}, {status['elapsed']:.0f}s"]
+    for stage, progress in status["stages"].items():
+        if progress["total"]:
+            lines.append(f"- {stage}: {progress['done'] or 0}/{progress['total']}")
+        elif progress["done"] is not None:
+            lines.append(f"- {stage}: {progress['done']}")
+        else:
+            lines.append(f"- {stage}")
+    if status["message"]:
+        lines.append(status["message"])
+    if status["error"]:
+        lines.append(f"Error: {status['error']}")
+    return "\n".join(lines)
@@ -0,0 +1,30 @@
+import re
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from src.llm_cache import get_cache, make_key
+
+
+class LangChainDiskCache(BaseCache):
+    """
+    Lets `ChatOpenAI` use the same disk cache as the direct OpenAI calls.
+    `llm_string` holds the model name and parameters (temperature, stop words, ...).
+    """
+    def __init__(self, cache=None):
+        self.cache = cache or get_cache()
+
+    def _use_cache(self, llm_string):
+        match = re.search(r"temperature\W+([0-9.]+)", llm_string)
+        return self.cache.should_cache(float(match.group(1)) if match else None)
+
+    def lookup(self, prompt, llm_string):
+        if not self._use_cache(llm_string):
+            return None
+        value = self.cache.get(make_key("langchain", llm_string, prompt))
+        return loads(value) if value is not None else None
+
+    def update(self, prompt, llm_string, return_val):
+        if self._use_cache(llm_string):
+            self.cache.set(make_key("langchain", llm_string, prompt), dumps(return_val))
+
+    def clear(self, **kwargs):
+        self.cache.clear()
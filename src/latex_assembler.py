@@ -0,0 +1,191 @@
+import os
+import re
+from src.llm_cache import chat_completion
+from src.latex_build import compile_latex, LatexError
+from src.latex_tables import escape_latex
+
+# Number of fragments sent back to the LLM before giving up on the assembled report.
+MAX_REPAIRS = 3
+PREAMBLE = r"""\documentclass[UTF8]{ctexart}
+\usepackage[margin=1in]{geometry}
+\usepackage{amsmath}
+\usepackage{amssymb}
+\usepackage{graphicx}
+\usepackage{float}
+\usepackage{booktabs}
+\usepackage{longtable}
+\title{%(title)s}
+\date{\today}
+
+\begin{document}
+\maketitle
+"""
+# Lines of a section draft that belong to the preamble or the document environment, which the assembler writes itself.
+DOCUMENT_LINES = re.compile(r"^[ \t]*\\(?:(?:documentclass|usepackage|title|author|date|maketitle)\b|begin\{document\}|end\{document\}).*\n?", re.MULTILINE)
+# Environments whose lines are never taken for markdown: a `- x &= y` line of an align is a minus sign, not a list item.
+PROTECTED_ENVIRONMENTS = (
+    "equation", "align", "alignat", "gather", "multline", "flalign", "eqnarray", "displaymath", "math",
+    "split", "aligned", "gathered", "cases", "array", "matrix", "pmatrix", "bmatrix", "vmatrix", "Vmatrix",
+    "tabular", "tabularx", "longtable", "verbatim", "lstlisting", "minted", "comment",
+)
+_environment_re = re.compile(r"\\(begin|end)\{(%s)\*?\}" % "|".join(PROTECTED_ENVIRONMENTS))
+# $$, \[ and \] (but not the \\ line break followed by a [length]).
+_display_re = re.compile(r"\$\$|(?<!\\)\\[\[\]]")
+
+
+def strip_code_fences(code):
+    return re.sub(r"^\s*```[a-zA-Z]*\s*$", "", code, flags=re.MULTILINE)
+
+def _markdown_line(line):
+    """
+    The LaTeX of one line of text outside any math or tabular environment, and the list it belongs to (or None).
+    """
+    line = re.sub(r"^\s*###\s+(.+)$", r"\\subsubsection{\1}", line)
+    line = re.sub(r"^\s*##\s+(.+)$", r"\\subsection{\1}", line)
+    line = re.sub(r"^\s*#\s+(.+)$", r"\\section{\1}", line)
+    line = re.sub(r"\*\*([^*\n]+)\*\*", r"\\textbf{\1}", line)
+    line = re.sub(
+        r"!\[([^\]]*)\]\(([^)\s]+)\)",
+        lambda m: "\\begin{figure}[H]\n\\centering\n"
+                  f"\\includegraphics[width=0.8\\textwidth]{{{m.group(2)}}}\n"
+                  f"\\caption{{{m.group(1)}}}\n\\end{{figure}}",
+        line,
+    )
+    bullet = re.match(r"^\s*[-*]\s+(.*)$", line)
+    numbered = re.match(r"^\s*\d+[.)]\s+(.*)$", line)
+    if bullet or numbered:
+        return rf"\item {(bullet or numbered).group(1)}", "itemize" if bullet else "enumerate"
+    return line, None
+
+def markdown_to_latex(code):
+    """
+    Convert the markdown the models slip into LaTeX drafts: headings, bold, lists and images.
+    Lines inside math, tabular and verbatim environments (and \\[ \\] or $$ displays) are left untouched.
+    """
+    out, current = [], None
+    # Depth of the protected environments the line is in, and whether it is inside a \[ \] or $$ display.
+    depth, display = 0, False
+    for line in code.split("\n"):
+        boundaries = _display_re.findall(line)
+        environments = _environment_re.findall(line)
+        # A line opening or closing a protected block belongs to it.
+        protected = depth > 0 or display or bool(boundaries) or bool(environments)
+        for kind, _ in environments:
+            depth = depth + 1 if kind == "begin" else max(depth - 1, 0)
+        for boundary in boundaries:
+            display = not display if boundary == "$$" else boundary == "\\["
+        kind = None
+        if not protected:
+            line, kind = _markdown_line(line)
+        if kind != current:
+            if current:
+                out.append(rf"\end{{{current}}}")
+            if kind:
+                out.append(rf"\begin{{{kind}}}")
+            current = kind
+        out.append(line)
+    if current:
+        out.append(rf"\end{{{current}}}")
+    return "\n".join(out)
+
+def _inline_inputs(code, workspace):
+    # The tables are copied into the document, so the line numbers of the errors all refer to the report itself.
+    def replace(match):
+        path = os.path.join(workspace, match.group(1))
+        if not path.endswith(".tex"):
+            path += ".tex"
+        if not os.path.exists(path):
+            return match.group(0)
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    return re.sub(r"\\input\{([^}]+)\}", replace, code)
+
+def clean_section(code, workspace):
+    """
+    A section draft ready to be put in the document: no code fences, no preamble lines, markdown converted,
+    figures and tables pinned with [H], notes like `（见 plots/figure.png）` removed and the tables inlined.
+    """
+    code = strip_code_fences(code)
+    code = DOCUMENT_LINES.sub("", code)
+    code = markdown_to_latex(code)
+    code = re.sub(r"\\begin\{(figure|table)\}(\[[^\]]*\])?", r"\\begin{\1}[H]", code)
+    code = re.sub(r"[（(]\s*见\s*[^）)]*?\.(png|pdf|svg)\s*[）)]", "", code)
+    return _inline_inputs(code, workspace)
+
+def split_fragments(code):
+    """
+    Split LaTeX code on its blank lines, without ever cutting an environment in two.
+    """
+    fragments, current, depth = [], [], 0
+    for block in re.split(r"\n\s*\n", code):
+        if not block.strip():
+            continue
+        current.append(block.strip("\n"))
+        depth += len(re.findall(r"\\begin\{", block)) - len(re.findall(r"\\end\{", block))
+        if depth <= 0:
+            fragments.append("\n\n".join(current))
+            current, depth = [], 0
+    if current:
+        fragments.append("\n\n".join(current))
+    return fragments
+
+def render_document(fragments, title):
+    """
+    The full source of the report and the (first line, last line) of each fragment in it.
+    """
+    lines = (PREAMBLE % {"title": escape_latex(title)}).split("\n")
+    spans = []
+    for fragment in fragments:
+        start = len(lines) + 1
+        lines.extend(fragment.split("\n"))
+        spans.append((start, len(lines)))
+        lines.append("")
+    lines.append(r"\end{document}")
+    return "\n".join(lines) + "\n", spans
+
+def repair_fragment(fragment, error, chat_model, client):
+    """
+    Ask the LLM to fix one fragment of the report that xelatex failed on.
+    """
+    answer = chat_completion(
+        client,
+        model=chat_model,
+        messages=[
+            {"role": "system", "content": "你是一位会书写 LaTeX 实验报告的有用助手。"},
+            {"role": "user", "content": (
+                f"以下 LaTeX 片段在用 xelatex（ctexart 文档类，已调用 amsmath、amssymb、graphicx、float、booktabs、longtable 宏包）编译时出错：\n"
+                f"错误信息：{error}\n"
+                f"片段：\n{fragment}\n"
+                "要求：只修正导致错误的地方，不要删减或改写其他内容；只输出修正后的片段，"
+                "不要输出导言区、\\begin{document} 或 latex```。"
+            )},
+        ],
+        temperature=0,
+    )
+    return DOCUMENT_LINES.sub("", strip_code_fences(answer)).strip()
+
+def build_report(sections, title, tex_path, build_dir, chat_model, client, max_repairs=MAX_REPAIRS, progress=None, state_key=None):
+    """
+    Assemble the section drafts into a report with a fixed preamble and compile it.
+    When xelatex fails on a line of a fragment, only that fragment is sent to the LLM for repair,
+    at most `max_repairs` times. Raises `LatexError` if the report still doesn't compile,
+    or if the error can't be traced back to a fragment. `state_key` is passed on to `compile_latex`.
+    Returns the path of the PDF.
+    """
+    workspace = os.path.dirname(os.path.abspath(tex_path))
+    fragments = [fragment for code in sections for fragment in split_fragments(clean_section(code, workspace))]
+    for attempt in range(max_repairs + 1):
+        source, spans = render_document(fragments, title)
+        with open(tex_path, "w", encoding="utf-8") as f:
+            f.write(source)
+        try:
+            return compile_latex(tex_path, build_dir, progress=progress, state_key=state_key)
+        except LatexError as e:
+            if attempt == max_repairs or not e.errors:
+                raise
+            message, line = e.errors[0]
+            index = next((i for i, (start, end) in enumerate(spans) if line is not None and start <= line <= end), None)
+            if index is None:
+                raise
+            print(f"Repairing fragment {index + 1}/{len(fragments)} ({message}, line {line}).")
+            fragments[index] = repair_fragment(fragments[index], f"{message}（第 {line - spans[index][0] + 1} 行）", chat_model, client)
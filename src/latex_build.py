@@ -0,0 +1,124 @@
+import os
+import re
+import shutil
+import hashlib
+import subprocess
+from src.progress import Progress
+from src.llm_cache import CACHE_ROOT
+from src.atomic import atomic_path
+
+# The .aux and lists of contents of the last build of each report, kept between jobs.
+BUILD_CACHE_DIR = os.path.join(CACHE_ROOT, "latex")
+
+# Seconds a single xelatex pass may take, then it is killed.
+COMPILE_TIMEOUT = 120
+MAX_PASSES = 3
+# Files whose content is read back by the next pass: lists of contents, figures and tables.
+LIST_EXTENSIONS = ("toc", "lof", "lot")
+STATE_EXTENSIONS = ("aux",) + LIST_EXTENSIONS
+# Lines of the .aux file holding cross references. The rest (page count, \@writefile...) doesn't call for a rerun.
+REFERENCE_LINES = ("\\newlabel", "\\bibcite")
+RERUN_PATTERN = re.compile(r"Rerun to get|Label\(s\) may have changed|Rerun LaTeX")
+
+
+class LatexError(RuntimeError):
+    """
+    xelatex failed: the errors of its log as (message, line number in the .tex file or None), and the whole log.
+    """
+    def __init__(self, message, errors=(), log=""):
+        super().__init__(message)
+        self.errors = list(errors)
+        self.log = log
+
+
+def parse_errors(log):
+    """
+    The errors of a xelatex log: each `! message` with the line number of the following `l.<n>` line, if any.
+    """
+    errors = []
+    lines = log.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith("! "):
+            line_number = None
+            for following in lines[i + 1:i + 30]:
+                match = re.match(r"l\.(\d+)", following)
+                if match:
+                    line_number = int(match.group(1))
+                    break
+                if following.startswith("! "):
+                    break
+            errors.append((line[2:].strip(), line_number))
+    return errors
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+def rerun_state(build_dir, job_name):
+    """
+    Hash of what the next pass would read back: the cross references of the .aux file and the lists of contents.
+    """
+    digest = hashlib.sha256()
+    aux = _read(os.path.join(build_dir, f"{job_name}.aux"))
+    for line in aux.splitlines():
+        if line.startswith(REFERENCE_LINES):
+            digest.update(line.encode("utf-8"))
+    for ext in LIST_EXTENSIONS:
+        digest.update(ext.encode("utf-8"))
+        digest.update(_read(os.path.join(build_dir, f"{job_name}.{ext}")).encode("utf-8"))
+    return digest.hexdigest()
+
+def _copy_state(source_dir, target_dir, job_name):
+    os.makedirs(target_dir, exist_ok=True)
+    for ext in STATE_EXTENSIONS:
+        source = os.path.join(source_dir, f"{job_name}.{ext}")
+        if os.path.exists(source):
+            target = os.path.join(target_dir, f"{job_name}.{ext}")
+            with atomic_path(target) as tmp_path:
+                shutil.copyfile(source, tmp_path)
+
+def compile_latex(tex_path, build_dir, timeout=COMPILE_TIMEOUT, max_passes=MAX_PASSES, progress=None, state_key=None, cache_dir=BUILD_CACHE_DIR):
+    """
+    Compile `tex_path` with xelatex into `build_dir` and return the path of the PDF.
+    Another pass only runs when the previous one changed the cross references or the lists of contents,
+    or when the log asks for it. With a `state_key` (e.g. the book and the title of the report), the .aux
+    and lists of contents of the last successful build under that key are copied into `build_dir` first
+    and saved back afterwards, so a new job recompiling the same report usually needs a single pass.
+    Relative paths of the source (figures, \\input tables) are resolved from the directory of `tex_path`.
+    """
+    progress = progress or Progress()
+    source_dir, tex_name = os.path.split(os.path.abspath(tex_path))
+    job_name = os.path.splitext(tex_name)[0]
+    os.makedirs(build_dir, exist_ok=True)
+    state_dir = os.path.join(cache_dir, state_key) if state_key else None
+    if state_dir and os.path.isdir(state_dir):
+        _copy_state(state_dir, build_dir, job_name)
+    command = [
+        "xelatex",
+        "-interaction=nonstopmode",
+        "-halt-on-error",
+        "-no-file-line-error",
+        f"-output-directory={os.path.abspath(build_dir)}",
+        tex_name,
+    ]
+    log_path = os.path.join(build_dir, f"{job_name}.log")
+    for compile_pass in range(1, max_passes + 1):
+        before = rerun_state(build_dir, job_name)
+        try:
+            result = subprocess.run(command, cwd=source_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise LatexError(f"xelatex took more than {timeout} seconds on {tex_name}.", log=_read(log_path))
+        log = _read(log_path) or result.stdout.decode("utf-8", errors="replace")
+        if result.returncode != 0:
+            errors = parse_errors(log)
+            summary = "; ".join(f"{message} (line {line})" for message, line in errors[:3]) or "see the log"
+            raise LatexError(f"xelatex failed on {tex_name}: {summary}", errors, log)
+        progress.update("compile", compile_pass, message=f"xelatex pass {compile_pass} done.")
+        if rerun_state(build_dir, job_name) == before and not RERUN_PATTERN.search(log):
+            break
+    if state_dir:
+        _copy_state(build_dir, state_dir, job_name)
+    return os.path.join(build_dir, f"{job_name}.pdf")
@@ -0,0 +1,100 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Tables longer than this are emitted as `longtable`, which LaTeX splits across pages.
+LONGTABLE_ROWS = 30
+LATEX_SPECIALS = {
+    "\\": r"\textbackslash{}",
+    "&": r"\&",
+    "%": r"\%",
+    "$": r"\$",
+    "#": r"\#",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+    "^": r"\textasciicircum{}",
+}
+_special_re = re.compile("|".join(re.escape(char) for char in LATEX_SPECIALS))
+
+
+def escape_latex(text):
+    """
+    Escape the characters LaTeX gives a meaning to.
+    """
+    return _special_re.sub(lambda m: LATEX_SPECIALS[m.group(0)], str(text))
+
+def format_column(series, digits=4):
+    """
+    Cells of a column as LaTeX strings, formatted for the whole column at once:
+    integers as they are, floats with `digits` significant digits and powers of ten in math mode.
+    The floats of a column share one number of decimals, trailing zeros included (1.2 next to 1.25 is 1.20),
+    or, when some of them need a power of ten, one number of significant digits.
+    Missing values are left empty.
+    """
+    missing = series.isna().to_numpy()
+    if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+        cells = series.astype(str).map(escape_latex)
+    elif pd.api.types.is_integer_dtype(series):
+        cells = pd.Series(np.char.mod("%d", series.to_numpy(dtype=np.int64, na_value=0)), index=series.index)
+    else:
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        shortest = np.char.mod(f"%.{digits}g", values[np.isfinite(values)]).astype(str)
+        if np.any(np.char.find(shortest, "e") >= 0):
+            # 1.5e-05 -> $1.500\times10^{-5}$
+            cells = pd.Series(np.char.mod(f"%#.{digits}g", values), index=series.index)
+            cells = cells.str.replace(r"\.(?=e|$)", "", regex=True)
+            cells = cells.str.replace(r"^(-?[\d.]+)e([+-])(\d+)$", _exponent, regex=True)
+        else:
+            # Decimals of the value that needs the most of them to show `digits` significant digits.
+            point = np.char.find(shortest, ".")
+            decimals = int(np.where(point >= 0, np.char.str_len(shortest) - point - 1, 0).max(initial=0))
+            cells = pd.Series(np.char.mod(f"%.{decimals}f", values), index=series.index)
+    cells = cells.where(~missing, "")
+    return cells.to_numpy(dtype=object)
+
+def _exponent(match):
+    mantissa, sign, power = match.groups()
+    power = power.lstrip("0") or "0"
+    return rf"${mantissa}\times10^{{{'-' if sign == '-' else ''}{power}}}$"
+
+def dataframe_to_latex(df, caption="", label="", digits=4, longtable_rows=LONGTABLE_ROWS):
+    """
+    LaTeX code of a dataframe as a booktabs table: a floating `tabular` for short tables,
+    a `longtable` repeating its header on every page for long ones.
+    """
+    nrows, ncols = df.shape
+    header = " & ".join(escape_latex(column) for column in df.columns) + r" \\"
+    columns = [format_column(df[column], digits) for column in df.columns]
+    if ncols:
+        rows = [" & ".join(cells) + r" \\" for cells in zip(*columns)]
+    else:
+        rows = []
+    spec = "c" * max(ncols, 1)
+    caption_line = rf"\caption{{{escape_latex(caption)}}}" if caption else ""
+    label_line = rf"\label{{{label}}}" if label else ""
+    if nrows > longtable_rows:
+        head = [
+            rf"\begin{{longtable}}{{{spec}}}",
+            caption_line + label_line + (r" \\" if caption_line or label_line else ""),
+            r"\toprule", header, r"\midrule", r"\endfirsthead",
+            r"\toprule", header, r"\midrule", r"\endhead",
+            r"\bottomrule", r"\endlastfoot",
+        ]
+        lines = [line for line in head if line] + rows + [r"\end{longtable}"]
+    else:
+        lines = [
+            r"\begin{table}[H]",
+            r"\centering",
+            caption_line,
+            label_line,
+            rf"\begin{{tabular}}{{{spec}}}",
+            r"\toprule", header, r"\midrule",
+            *rows,
+            r"\bottomrule",
+            r"\end{tabular}",
+            r"\end{table}",
+        ]
+        lines = [line for line in lines if line]
+    return "\n".join(lines) + "\n"
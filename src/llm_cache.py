@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import threading
+from src.atomic import atomic_path
+
+# Root of the caches kept between runs.
+CACHE_ROOT = os.getenv(
+    "LABOTEX_CACHE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "cache")),
+)
+
+
+class DiskCache:
+    """
+    Content addressed cache of LLM answers, one json file per entry.
+    Once the entries take more than `max_bytes`, the least recently used ones are evicted
+    (a hit refreshes the modification time of its entry).
+    """
+    def __init__(self, cache_dir, max_bytes, cache_nonzero_temperature=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.cache_nonzero_temperature = cache_nonzero_temperature
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._sizes = {}
+        for name in os.listdir(cache_dir):
+            if name.endswith(".json"):
+                self._sizes[name[:-5]] = os.path.getsize(os.path.join(cache_dir, name))
+        self._total = sum(self._sizes.values())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def should_cache(self, temperature):
+        return self.cache_nonzero_temperature or not temperature
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)["value"]
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"value": value}, f, ensure_ascii=False)
+            size = os.path.getsize(tmp_path)
+        with self._lock:
+            self._total += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Remove the least recently used entries until the cache is back to 90% of its budget.
+        entries = []
+        for key in self._sizes:
+            try:
+                entries.append((os.path.getmtime(self._path(key)), key))
+            except OSError:
+                entries.append((0, key))
+        for _, key in sorted(entries):
+            if self._total <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._total -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._sizes):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._sizes = {}
+            self._total = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._sizes), "bytes": self._total}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """
+    The LLM cache shared by all the agents of the process.
+    Configured by LABOTEX_CACHE_DIR, LABOTEX_LLM_CACHE_MAX_MB and LABOTEX_CACHE_NONZERO_TEMPERATURE.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache(
+                os.path.join(CACHE_ROOT, "llm"),
+                max_bytes=int(float(os.getenv("LABOTEX_LLM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+                cache_nonzero_temperature=os.getenv("LABOTEX_CACHE_NONZERO_TEMPERATURE", "1") != "0",
+            )
+        return _cache
+
+def make_key(*parts):
+    """
+    Hash of json serializable request parts, e.g. base url, model, messages and temperature.
+    """
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def chat_completion(client, model, messages, temperature=None, cache=None):
+    """
+    `client.chat.completions.create` through the LLM cache. Returns the content of the answer.
+    """
+    cache = cache or get_cache()
+    use_cache = cache.should_cache(temperature)
+    if use_cache:
+        key = make_key(str(client.base_url), model, messages, temperature)
+        content = cache.get(key)
+        if content is not None:
+            return content
+    kwargs = {} if temperature is None else {"temperature": temperature}
+    response = client.chat.completions.create(model=model, messages=messages, **kwargs)
+    content = response.choices[0].message.content
+    if use_cache:
+        cache.set(key, content)
+    return content
@@ -1,27 +1,47 @@
-import gradio as gr
-from src.book_agent import pdf_to_json
-from src.agent1 import write_experiment_introduction
-from src.agent2 import data_processing_agent
-from src.agent3 import write_final_report
+from src.pipeline import TaskGraph
+from src.llm_cache import get_cache
+from src.config import CFG, JOBS_DIR
+from src.jobs import JobQueue, format_status
 import os
+import time
 import shutil
-
-class CFG:
-    def __init__(self, title, dir_name, chat_model, vl_model, prompt):
-        self.title = title
-        self.dir_name = dir_name
-        self.data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
-        self.chat_model = chat_model
-        self.vl_model = vl_model
-        self.prompt = prompt
-
-def page_one_action(dir_name, vl_model, api_key, base_url, file_input):
+import threading
+import importlib
+
+# Jobs running at the same time, each in its own workspace.
+JOB_WORKERS = int(os.getenv("LABOTEX_JOB_WORKERS", "4"))
+# Created by `build_demo`: the sandbox and render workers are spawned processes that import this module again,
+# they must not get a queue (nor a UI) of their own.
+job_queue = None
+# The agents pull in langchain, pandas, matplotlib and pdf2image, so they are imported by the jobs
+# that use them rather than when the server starts.
+AGENT_MODULES = ("src.book_agent", "src.book_compiler", "src.context", "src.agent1", "src.agent2", "src.agent3")
+
+
+def preload_agents():
+    """
+    Import the agent modules in the background once the server is up, so the first job doesn't pay for it.
+    """
+    for module in AGENT_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print(f"Could not preload {module}: {e}")
+
+
+def page_one_action(job, dir_name, vl_model, api_key, base_url, file_input, ocr_workers, chat_model):
+    from src.book_agent import pdf_to_json
+    from src.book_compiler import compile_book
     cfg = CFG(
         title="none",
         dir_name=dir_name,
-        chat_model="none",
+        chat_model=chat_model.strip() or "none",
         vl_model=vl_model,
-        prompt="none"
+        prompt="none",
+        api_key=api_key,
+        base_url=base_url,
+        ocr_workers=int(ocr_workers),
+        progress=job
     )
     # Create the target directory if it doesn't exist
     base_books_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "books"))
@@ -35,125 +55,183 @@ def page_one_action(dir_name, vl_model, api_key, base_url, file_input):
         dest_path = os.path.join(target_dir, filename)
         shutil.move(file_input.name, dest_path)
 
-    os.environ["OPENAI_API_KEY"] = api_key
-    os.environ["OPENAI_BASE_URL"] = base_url
-
-    try:
-        pdf_to_json(cfg)
-        return "Book Successfully Loaded!"
-    except Exception as e:
-        return "Failed to Load the Book."
+    # Errors are left to the job queue, which marks the job as failed with the error.
+    pdf_to_json(cfg)
+    # Precompute what every report on the book needs from it, once for the whole class.
+    if chat_model.strip():
+        compile_book(cfg)
+    return "Book Successfully Loaded!"
 
 
-def page_two_action(dir_name, title, chat_model, api_key, base_url,file_input, prompt):
+def page_two_action(job, dir_name, title, chat_model, api_key, base_url,file_input, prompt):
+    from src.context import RunContext
+    from src.agent1 import write_experiment_introduction
+    from src.agent2 import data_processing_agent
+    from src.agent3 import write_final_report
     cfg = CFG(
         title=title,
         dir_name=dir_name,
         chat_model=chat_model,
         vl_model="none",
-        prompt=prompt
+        prompt=prompt,
+        api_key=api_key,
+        base_url=base_url,
+        workspace=os.path.join(JOBS_DIR, job.id),
+        progress=job
     )
-    os.environ["OPENAI_API_KEY"] = api_key
-    os.environ["OPENAI_BASE_URL"] = base_url
 
     os.makedirs(cfg.data_dir, exist_ok=True)
-    # Delete all files in cfg.data_dir if any exist
-    for filename in os.listdir(cfg.data_dir):
-        file_path = os.path.join(cfg.data_dir, filename)
-        if os.path.isfile(file_path) or os.path.islink(file_path):
-            os.unlink(file_path)
-        elif os.path.isdir(file_path):
-            shutil.rmtree(file_path)
-
     if file_input is not None:
         for file in file_input:
             filename = os.path.basename(file.name)
             dest_path = os.path.join(cfg.data_dir, filename)
             shutil.move(file.name, dest_path)
 
-    tmp_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tmp"))
-    os.makedirs(tmp_dir, exist_ok=True)
-    # Delete all files and folders in tmp_dir if any exist
-    for filename in os.listdir(tmp_dir):
-        file_path = os.path.join(tmp_dir, filename)
-        if os.path.isfile(file_path) or os.path.islink(file_path):
-            os.unlink(file_path)
-        elif os.path.isdir(file_path):
-            shutil.rmtree(file_path)
-
-    write_experiment_introduction(cfg)
+    # The book section, its title and task summary are resolved once and shared by the agents.
+    ctx = RunContext(cfg)
 
-    data_processing_agent(cfg)
+    # The introduction and the data processing only need the book section, so they run side by side.
+    graph = TaskGraph()
+    graph.add("section", lambda: ctx.text)
+    graph.add("task_summary", lambda: ctx.task_summary, deps=["section"])
+    graph.add("introduction", lambda: write_experiment_introduction(ctx), deps=["section"])
+    graph.add("data_processing", lambda: data_processing_agent(ctx), deps=["task_summary"])
+    graph.add("report", lambda: write_final_report(ctx), deps=["introduction", "data_processing"])
+    graph.run(progress=job)
+    print(f"LLM cache: {get_cache().stats()}")
 
-    write_final_report(cfg)
+    pdf_path = os.path.join(cfg.output_dir, f"{title}.pdf")
 
-    pdf_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "final_pdf", f"{title}.pdf"))
-
-    plots_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "plots"))
-    data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
-    tmp_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tmp"))
-    if os.path.isdir(plots_dir):
-        shutil.rmtree(plots_dir)
-    if os.path.isdir(data_dir):
-        shutil.rmtree(data_dir)
-    if os.path.isdir(tmp_dir):
-        shutil.rmtree(tmp_dir)
+    # Only the report itself is kept in the workspace.
+    if os.path.isdir(cfg.plots_dir):
+        shutil.rmtree(cfg.plots_dir)
+    if os.path.isdir(cfg.data_dir):
+        shutil.rmtree(cfg.data_dir)
 
     return "Report Successfully Written!", pdf_path
 
+def wait_for_job(job_id):
+    """
+    Stream the status of a job until it finishes.
+    """
+    while True:
+        status = job_queue.status(job_id)
+        yield status
+        if status["state"] in ("done", "failed"):
+            return
+        time.sleep(1)
+
+def run_page_one_action(dir_name, vl_model, api_key, base_url, file_input, ocr_workers, chat_model):
+    job_id = job_queue.submit("book", page_one_action, dir_name, vl_model, api_key, base_url, file_input, ocr_workers, chat_model)
+    for status in wait_for_job(job_id):
+        if status["state"] == "done":
+            yield job_id, job_queue.get(job_id).result
+        else:
+            yield job_id, format_status(status)
+
 def run_page_two_action(dir_name, title, chat_model, api_key, base_url, file_input, prompt):
-    msg, pdf_path = page_two_action(dir_name, title, chat_model, api_key, base_url, file_input, prompt)
-    return msg, pdf_path
+    job_id = job_queue.submit("report", page_two_action, dir_name, title, chat_model, api_key, base_url, file_input, prompt)
+    for status in wait_for_job(job_id):
+        if status["state"] == "done":
+            msg, pdf_path = job_queue.get(job_id).result
+            yield job_id, msg, pdf_path
+        else:
+            yield job_id, format_status(status), ""
+
+def job_status(job_id):
+    """
+    Status of a job and, once it is done, the files it produced.
+    """
+    job_id = job_id.strip()
+    artifacts = job_queue.artifacts(job_id)
+    status = job_queue.status(job_id)
+    if status is None and artifacts:
+        return "Job finished.", artifacts[0]
+    return format_status(status), (artifacts[0] if artifacts else None)
 
 def get_pdf_path(pdf_path):
         return pdf_path
 
-with gr.Blocks() as demo:
-    gr.Markdown("## Choose What to Do")
-    btn1 = gr.Button("Add New Instruction Books", link="/page-one")
-    btn2 = gr.Button("Write Reports", link="/page-two")
-    # use dummy placeholders so buttons don't error out
-    dummy = gr.Textbox(visible=False)
-
-with demo.route("Add New Instruction Books", "/page-one"):
-    inp1 = gr.Textbox(label="Book Name", placeholder="single English word without space")
-    inp2 = gr.Textbox(label="Vision Language Model Name")
-    inp3 = gr.Textbox(label="API Key", type="password")
-    inp4 = gr.Textbox(label="Base URL")
-    file_input = gr.File(label="Drag Your PDF Here", file_types=[".pdf"])    
-    submit_btn = gr.Button("Start to Load")
-    out1 = gr.Textbox(label="Output", visible=True)
-    submit_btn.click(
-        fn=page_one_action,
-        inputs=[inp1, inp2, inp3, inp4, file_input],
-        outputs=out1
-    )
-   
-with demo.route("Write Reports", "/page-two"):
-    inp1 = gr.Textbox(label="Reference Book Name")
-    inp2 = gr.Textbox(label="Title of the Report")
-    inp3 = gr.Textbox(label="Chat Model Name")    
-    inp4 = gr.Textbox(label="API Key", type="password")
-    inp5 = gr.Textbox(label="Base URL")
-    file_input = gr.File(label="Drag Your CSV Files Here", file_types=[".csv"], file_count="multiple")
-    inp6 = gr.Textbox(label="Description of Your CSV Files")
-    generate_btn = gr.Button("Generate PDF")
-    out1 = gr.Textbox(label="Output", visible=True)
-    pdf_path_box = gr.Textbox(label="PDF Path", visible=False)
-    download_btn = gr.DownloadButton("Download PDF", visible=True)
-
-    generate_btn.click(
-        fn=run_page_two_action,
-        inputs=[inp1, inp2, inp3, inp4, inp5, file_input, inp6],
-        outputs=[out1, pdf_path_box]
-    )    
-
-    download_btn.click(
-        fn=get_pdf_path,
-        inputs=[pdf_path_box],
-        outputs=[download_btn]
-    )
-    
+def build_demo():
+    """
+    The job queue and the web interface of the server.
+    """
+    global job_queue
+    import gradio as gr
+    job_queue = JobQueue(max_workers=JOB_WORKERS)
+
+    with gr.Blocks() as demo:
+        gr.Markdown("## Choose What to Do")
+        btn1 = gr.Button("Add New Instruction Books", link="/page-one")
+        btn2 = gr.Button("Write Reports", link="/page-two")
+        btn3 = gr.Button("Job Status", link="/jobs")
+        # use dummy placeholders so buttons don't error out
+        dummy = gr.Textbox(visible=False)
+
+    with demo.route("Add New Instruction Books", "/page-one"):
+        inp1 = gr.Textbox(label="Book Name", placeholder="single English word without space")
+        inp2 = gr.Textbox(label="Vision Language Model Name")
+        inp3 = gr.Textbox(label="API Key", type="password")
+        inp4 = gr.Textbox(label="Base URL")
+        file_input = gr.File(label="Drag Your PDF Here", file_types=[".pdf"])    
+        inp5 = gr.Number(label="Pages Processed Concurrently", value=4, minimum=1, precision=0)
+        inp6 = gr.Textbox(label="Chat Model Name for Precompiling Reports (optional)")
+        submit_btn = gr.Button("Start to Load")
+        job_box = gr.Textbox(label="Job ID")
+        out1 = gr.Textbox(label="Output", visible=True)
+        submit_btn.click(
+            fn=run_page_one_action,
+            inputs=[inp1, inp2, inp3, inp4, file_input, inp5, inp6],
+            outputs=[job_box, out1],
+            api_name="submit_book"
+        )
+
+    with demo.route("Write Reports", "/page-two"):
+        inp1 = gr.Textbox(label="Reference Book Name")
+        inp2 = gr.Textbox(label="Title of the Report")
+        inp3 = gr.Textbox(label="Chat Model Name")    
+        inp4 = gr.Textbox(label="API Key", type="password")
+        inp5 = gr.Textbox(label="Base URL")
+        file_input = gr.File(label="Drag Your CSV Files Here", file_types=[".csv"], file_count="multiple")
+        inp6 = gr.Textbox(label="Description of Your CSV Files")
+        generate_btn = gr.Button("Generate PDF")
+        job_box = gr.Textbox(label="Job ID")
+        out1 = gr.Textbox(label="Output", visible=True)
+        pdf_path_box = gr.Textbox(label="PDF Path", visible=False)
+        download_btn = gr.DownloadButton("Download PDF", visible=True)
+
+        generate_btn.click(
+            fn=run_page_two_action,
+            inputs=[inp1, inp2, inp3, inp4, inp5, file_input, inp6],
+            outputs=[job_box, out1, pdf_path_box],
+            api_name="submit_report"
+        )    
+
+        download_btn.click(
+            fn=get_pdf_path,
+            inputs=[pdf_path_box],
+            outputs=[download_btn]
+        )
+
+    with demo.route("Job Status", "/jobs"):
+        job_box = gr.Textbox(label="Job ID")
+        status_btn = gr.Button("Check Status")
+        status_out = gr.Textbox(label="Status", visible=True)
+        artifact_file = gr.File(label="Report")
+
+        status_btn.click(
+            fn=job_status,
+            inputs=[job_box],
+            outputs=[status_out, artifact_file],
+            api_name="job_status"
+        )
+    return demo
+
 
 if __name__ == "__main__":
+    demo = build_demo()
+    # Handlers only submit and poll jobs, the job queue caps how many of them run at once.
+    demo.queue(default_concurrency_limit=None)
+    if os.getenv("LABOTEX_PRELOAD", "1") == "1":
+        threading.Thread(target=preload_agents, daemon=True).start()
     demo.launch()
\ No newline at end of file
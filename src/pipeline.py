@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class TaskGraph:
+    """
+    Small dependency graph of the stages of a run.
+    A stage starts as soon as all the stages it depends on are finished, so independent stages run concurrently.
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.tasks = {}
+
+    def add(self, name, fn, deps=()):
+        """
+        Add the stage `name`, running `fn()` once all the stages in `deps` are finished.
+        """
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Unknown dependency {dep} of stage {name}.")
+        self.tasks[name] = (fn, tuple(deps))
+
+    def run(self, progress=None):
+        """
+        Run all the stages and return their results by name.
+        The first failing stage stops the run: its exception is raised right away, stages not started yet are skipped
+        and stages still running are not waited for (their threads finish in the background, their results are dropped).
+        Finished stages are reported to `progress` under the "pipeline" stage.
+        """
+        results = {}
+        remaining = dict(self.tasks)
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while remaining or running:
+                for name, (fn, deps) in list(remaining.items()):
+                    if all(dep in results for dep in deps):
+                        running[executor.submit(fn)] = name
+                        del remaining[name]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        raise error
+                    results[name] = future.result()
+                    if progress is not None:
+                        progress.update("pipeline", len(results), len(self.tasks), f"Stage {name} finished.")
+        except BaseException:
+            # Leaving a `with` block would wait for the stages still running, e.g. a whole agent loop.
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return results
@@ -0,0 +1,68 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+def fingerprint(df):
+    """
+    Cheap content fingerprint of a dataframe, used to notice that a `data_processor` query changed it.
+    """
+    try:
+        content = int(pd.util.hash_pandas_object(df, index=True).values.sum()) if len(df) else 0
+    except TypeError:
+        # Unhashable cells (lists, dicts...): fall back on the identity of the dataframe.
+        content = id(df)
+    return (df.shape, tuple(map(str, df.columns)), tuple(map(str, df.dtypes)), content)
+
+def column_unit(column):
+    """
+    Unit written in a column name, e.g. "F/N", "x (cm)", "U[V]" or "t（s）" -> "N", "cm", "V", "s".
+    """
+    match = re.search(r"(?:\(([^()]+)\)|（([^（）]+)）|\[([^\[\]]+)\]|/\s*([^/\s]+))\s*$", str(column))
+    if match is None:
+        return ""
+    return next(group for group in match.groups() if group)
+
+def profile_dataframe(df, name=""):
+    """
+    Summary of a dataframe for the agent: shape, and for each column its dtype, unit, null count,
+    range and mean, and whether it is monotonic (evenly spaced: a likely independent variable).
+    All the statistics are computed column-wise with pandas / NumPy, not row by row.
+    """
+    nrows, ncols = df.shape
+    lines = [f"{name}: {nrows} rows x {ncols} columns"]
+    numeric = df.select_dtypes(include="number")
+    nulls = df.isna().sum()
+    stats = numeric.agg(["min", "max", "mean"]) if not numeric.empty else None
+    increasing, decreasing, regular = {}, {}, {}
+    if not numeric.empty and nrows > 1:
+        values = numeric.to_numpy(dtype=float)
+        steps = np.diff(values, axis=0)
+        with np.errstate(invalid="ignore"):
+            finite = np.isfinite(steps)
+            increasing = dict(zip(numeric.columns, np.all((steps > 0) | ~finite, axis=0)))
+            decreasing = dict(zip(numeric.columns, np.all((steps < 0) | ~finite, axis=0)))
+            # Evenly spaced steps are typical of a set (independent) variable.
+            spread = np.nanstd(np.where(finite, steps, np.nan), axis=0)
+            scale = np.nanmean(np.abs(np.where(finite, steps, np.nan)), axis=0)
+            regular = dict(zip(numeric.columns, spread <= 0.05 * scale))
+    for column in df.columns:
+        parts = [f"  - {column}: {df[column].dtype}"]
+        unit = column_unit(column)
+        if unit:
+            parts.append(f"unit {unit}")
+        if nulls[column]:
+            parts.append(f"{nulls[column]} nulls")
+        if stats is not None and column in stats.columns:
+            low, high, mean = stats[column]
+            parts.append(f"min {low:.6g}, max {high:.6g}, mean {mean:.6g}")
+            if increasing.get(column) or decreasing.get(column):
+                direction = "increasing" if increasing.get(column) else "decreasing"
+                if regular.get(column):
+                    parts.append(f"monotonic {direction}, evenly spaced (likely independent variable)")
+                else:
+                    parts.append(f"monotonic {direction}")
+        else:
+            parts.append(f"{df[column].nunique()} distinct values")
+        lines.append(", ".join(parts))
+    return "\n".join(lines)
@@ -0,0 +1,7 @@
+class Progress:
+    """
+    Receives the progress of a job, stage by stage (pages OCR'd, agent iterations, compile passes...).
+    This base class ignores it, it is used when a function runs outside of a job.
+    """
+    def update(self, stage, done=None, total=None, message=None):
+        pass
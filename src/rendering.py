@@ -0,0 +1,172 @@
+import os
+import shutil
+import hashlib
+import threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from src.config import ROOT_DIR
+from src.llm_cache import CACHE_ROOT, make_key
+from src.atomic import atomic_path
+
+FIGURES_CACHE_DIR = os.path.join(CACHE_ROOT, "figures")
+FONT_PATH = os.path.join(ROOT_DIR, "NotoSerifSC-Regular.ttf")
+# Formats xelatex can include directly. svg would need the `svg` package, inkscape and -shell-escape.
+FIGURE_FORMATS = ("pdf", "png")
+RENDER_WORKERS = int(os.getenv("LABOTEX_RENDER_WORKERS", "2"))
+# Bump when the look of the figures changes, so the cached ones are rendered again.
+RENDER_VERSION = "1"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def setup_matplotlib():
+    """
+    Register the CJK font and set the rcParams, once per process.
+    """
+    import matplotlib
+    import matplotlib.font_manager
+    from matplotlib.font_manager import FontProperties
+    matplotlib.use("Agg")  # Use non-interactive backend for plotting
+    if os.path.exists(FONT_PATH):
+        matplotlib.font_manager.fontManager.addfont(FONT_PATH)
+        matplotlib.rcParams["font.family"] = "sans-serif"
+        matplotlib.rcParams["font.sans-serif"] = [FontProperties(fname=FONT_PATH).get_name()]
+    else:
+        print(f"Font {FONT_PATH} not found, Chinese characters may not be displayed.")
+    matplotlib.rcParams["axes.unicode_minus"] = False
+
+
+def _draw_curve(fig, spec, data):
+    ax = fig.subplots()
+    ax.plot(data["x"], data["y"], marker="o")
+    ax.set_xlabel(spec["xlabel"])
+    ax.set_ylabel(spec["ylabel"], rotation=0)
+    ax.set_title(spec["title"])
+    ax.grid()
+
+def _draw_least_squares(fig, spec, data):
+    ax = fig.subplots()
+    ax.plot(data["x"], data["y"], "o")
+    ax.plot(data["line_x"], data["line_y"], "r-")
+    ax.set_xlabel(spec["xlabel"])
+    ax.set_ylabel(spec["ylabel"], rotation=0)
+    ax.set_title(spec["title"])
+    ax.grid()
+
+def _draw_table(fig, spec, data):
+    df = data["df"]
+    nrows, ncols = df.shape
+    # Size of the figure follows the dataframe: at least 6x4 inches, 1.2" per column and 0.4" per row.
+    fig.set_size_inches(max(6, ncols * 1.2), max(4, nrows * 0.4))
+    ax = fig.subplots()
+    ax.axis("off")
+    cell_text = [df.columns.tolist()] + df.values.tolist()
+    # Header row in bold on white, then alternate row coloring.
+    colors = [["#FFFFFF"] * ncols] + [["#f0f0f0" if i % 2 == 0 else "#ffffff"] * ncols for i in range(1, len(cell_text))]
+    table = ax.table(cellText=cell_text, cellColours=colors, loc="center", cellLoc="left")
+    table.auto_set_font_size(False)
+    table.set_fontsize(10)
+    table.scale(1, 1.5)
+    for i in range(ncols):
+        table[(0, i)].set_text_props(color="black", weight="bold")
+
+RENDERERS = {
+    "curve": (_draw_curve, {"figsize": (10, 6)}, {}),
+    "least_squares": (_draw_least_squares, {"figsize": (10, 6)}, {}),
+    "table": (_draw_table, {}, {"bbox_inches": "tight", "dpi": 400}),
+}
+
+
+def _render(kind, spec, data, fmt):
+    """
+    Render one figure with the object oriented API (no pyplot global state) and return the file content.
+    Runs in the worker processes of the pool.
+    """
+    import io
+    from matplotlib.figure import Figure
+    setup_matplotlib()
+    draw, figure_kwargs, save_kwargs = RENDERERS[kind]
+    fig = Figure(**figure_kwargs)
+    draw(fig, spec, data)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, **save_kwargs)
+    return buffer.getvalue()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def data_hash(data):
+    """
+    sha256 of the arrays and dataframes a figure is drawn from.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(data):
+        value = data[name]
+        digest.update(name.encode("utf-8"))
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr((list(map(str, value.columns)), list(map(str, value.dtypes)))).encode("utf-8"))
+            digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+        else:
+            array = np.ascontiguousarray(value)
+            digest.update(f"{array.dtype}{array.shape}".encode("utf-8"))
+            digest.update(array.tobytes() if array.dtype != object else repr(array.tolist()).encode("utf-8"))
+    return digest.hexdigest()
+
+def render_many(requests, fmt="pdf", cache_dir=FIGURES_CACHE_DIR):
+    """
+    Render figures given as (kind, spec, data, file_path) on the process pool, all at the same time,
+    and write them to their paths. Figures already rendered from the same data and spec are copied from the cache.
+    Returns the paths of the files.
+    """
+    if fmt not in FIGURE_FORMATS:
+        raise ValueError(f"Unknown figure format {fmt}, use one of {FIGURE_FORMATS}.")
+    os.makedirs(cache_dir, exist_ok=True)
+    pending = []
+    for kind, spec, data, file_path in requests:
+        cache_path = os.path.join(cache_dir, f"{make_key(RENDER_VERSION, kind, spec, data_hash(data), fmt)}.{fmt}")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if os.path.exists(cache_path):
+            shutil.copyfile(cache_path, file_path)
+            continue
+        try:
+            future = _get_pool().submit(_render, kind, spec, data, fmt)
+        except BrokenProcessPool:
+            _reset_pool()
+            future = _get_pool().submit(_render, kind, spec, data, fmt)
+        pending.append((future, cache_path, file_path))
+    for future, cache_path, file_path in pending:
+        try:
+            content = future.result()
+        except BrokenProcessPool:
+            # A dead worker breaks the whole pool, the next figures get a new one.
+            _reset_pool()
+            raise
+        with open(file_path, "wb") as f:
+            f.write(content)
+        with atomic_path(cache_path) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+    return [file_path for _, _, _, file_path in requests]
+
+def render(kind, spec, data, file_path, fmt="pdf", cache_dir=FIGURES_CACHE_DIR):
+    """
+    Render a single figure, see `render_many`.
+    """
+    return render_many([(kind, spec, data, file_path)], fmt=fmt, cache_dir=cache_dir)[0]
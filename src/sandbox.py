@@ -0,0 +1,215 @@
+import re
+import pickle
+import threading
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import pandas as pd
+from src.profiling import fingerprint
+
+try:
+    import pyarrow as pa
+except ImportError:
+    # Without pyarrow the dataframes go through the pipe as pickles.
+    pa = None
+
+try:
+    import resource
+except ImportError:
+    # No address space limit outside of Unix, only the time limit applies.
+    resource = None
+
+
+def pack_frame(df):
+    """
+    Put a dataframe into a shared memory block as an Arrow IPC stream, so only its name crosses the pipe.
+    Falls back to a pickle for dataframes Arrow can't hold.
+    """
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+        except (pa.ArrowException, ValueError, TypeError):
+            table = None
+        if table is not None:
+            # Measure the stream first, then write it straight into the shared memory block.
+            mock = pa.MockOutputStream()
+            with pa.ipc.new_stream(mock, table.schema) as writer:
+                writer.write_table(table)
+            size = mock.size()
+            block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            try:
+                sink = pa.FixedSizeBufferWriter(pa.py_buffer(block.buf))
+                with pa.ipc.new_stream(sink, table.schema) as writer:
+                    writer.write_table(table)
+                # Arrow must drop its views on the block before it can be closed.
+                del sink, writer
+            except BaseException:
+                block.close()
+                block.unlink()
+                raise
+            name = block.name
+            block.close()
+            # The receiver unlinks the block, the resource tracker of this process must not do it again.
+            resource_tracker.unregister(block._name, "shared_memory")
+            return ("arrow", name, size)
+    return ("pickle", pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL))
+
+def unpack_frame(payload):
+    """
+    Read a dataframe written by `pack_frame` and free its shared memory block.
+    """
+    if payload[0] == "pickle":
+        return pickle.loads(payload[1])
+    _, name, size = payload
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        # Copied out, so the dataframe doesn't keep views on a block that is about to be unlinked.
+        data = bytes(block.buf[:size])
+    finally:
+        block.close()
+        block.unlink()
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+def discard_frame(payload):
+    """
+    Free the shared memory block of a payload that will never be read.
+    """
+    if payload[0] == "arrow":
+        try:
+            block = shared_memory.SharedMemory(name=payload[1])
+            block.close()
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _worker_main(conn, memory_bytes):
+    """
+    Loop of the worker process: it holds its own `dfs` and runs the queries it receives on them.
+    """
+    if resource is not None and memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    dfs = {}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        command = message[0]
+        if command == "put":
+            dfs[message[1]] = unpack_frame(message[2])
+        elif command == "exec":
+            before = {name: fingerprint(df) for name, df in dfs.items()}
+            local_vars = {
+                "dfs": dfs,
+                "np": np,
+                "pd": pd,
+            }
+            try:
+                exec(message[1], {}, local_vars)
+                error = None
+            except BaseException as e:
+                error = f"Exception occurs: {'MemoryError: ' if isinstance(e, MemoryError) else ''}{e}"
+            # Send back only the dataframes the query created or changed.
+            changed = {}
+            for name, df in dfs.items():
+                if isinstance(df, pd.DataFrame) and before.get(name) != fingerprint(df):
+                    changed[name] = pack_frame(df)
+            deleted = [name for name in before if name not in dfs]
+            conn.send(("result", error, changed, deleted))
+        elif command == "stop":
+            return
+
+
+class SandboxExecutor:
+    """
+    Runs the code of `data_processor` in a persistent worker subprocess with a wall clock and a memory limit,
+    so a runaway query only costs its own process and never stalls the web server.
+    The dataframes of the tools stay the reference: the worker receives the ones a query needs,
+    and sends back the ones it changed.
+    """
+    def __init__(self, timeout=60, memory_mb=2048):
+        self.timeout = timeout
+        self.memory_bytes = int(memory_mb * 1024 * 1024) if memory_mb else 0
+        self.process = None
+        self.conn = None
+        # name -> fingerprint of the version of each dataframe the worker holds
+        self.synced = {}
+        self._lock = threading.Lock()
+
+    def _start(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, self.memory_bytes), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.synced = {}
+
+    def _kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+        self.process = None
+        self.conn = None
+        self.synced = {}
+
+    def _needed(self, code, dfs):
+        # Code going through the dict itself (dfs.items(), for name in dfs, ...) may touch any dataframe.
+        if re.search(r"\bdfs\b(?!\s*\[)", code):
+            return list(dfs)
+        return [name for name in dfs if name in code]
+
+    def _sync(self, code, dfs):
+        for name in self._needed(code, dfs):
+            df = dfs[name]
+            if not isinstance(df, pd.DataFrame):
+                continue
+            key = fingerprint(df)
+            if self.synced.get(name) != key:
+                self.conn.send(("put", name, pack_frame(df)))
+                self.synced[name] = key
+
+    def execute(self, code, dfs):
+        """
+        Run `code` on `dfs` in the worker and apply the changes it made to `dfs`.
+        Returns the error message of the query, or None if it succeeded.
+        """
+        with self._lock:
+            if self.process is None or not self.process.is_alive():
+                self._kill()
+                self._start()
+            try:
+                self._sync(code, dfs)
+                self.conn.send(("exec", code))
+                if not self.conn.poll(self.timeout):
+                    self._kill()
+                    return f"The query took more than {self.timeout} seconds and was stopped. The dataframes are unchanged."
+                _, error, changed, deleted = self.conn.recv()
+            except (EOFError, OSError, BrokenPipeError):
+                self._kill()
+                return "The query crashed the worker process (probably out of memory). The dataframes are unchanged."
+            for name, payload in changed.items():
+                try:
+                    dfs[name] = unpack_frame(payload)
+                    self.synced[name] = fingerprint(dfs[name])
+                except Exception:
+                    traceback.print_exc()
+                    discard_frame(payload)
+                    self.synced.pop(name, None)
+            for name in deleted:
+                if name in dfs:
+                    del dfs[name]
+                self.synced.pop(name, None)
+            return error
+
+    def close(self):
+        with self._lock:
+            if self.process is not None and self.process.is_alive():
+                try:
+                    self.conn.send(("stop",))
+                    self.process.join(timeout=5)
+                except (OSError, BrokenPipeError):
+                    pass
+            self._kill()
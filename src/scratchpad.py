@@ -0,0 +1,58 @@
+from src.chunking import estimate_tokens
+
+# Budget of the ReAct scratchpad resent to the model at every iteration, and of a single observation in it.
+SCRATCHPAD_TOKENS = 6000
+OBSERVATION_TOKENS = 800
+# The last steps are always kept in full, the older ones are summarized first.
+KEEP_RECENT_STEPS = 4
+
+
+def truncate_text(text, max_tokens=OBSERVATION_TOKENS):
+    """
+    Keep the beginning and the end of a text longer than `max_tokens`, e.g. a dataframe dump.
+    """
+    text = str(text)
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep = max(1, len(text) * max_tokens // tokens // 2)
+    return f"{text[:keep]}\n...（省略约 {tokens - max_tokens} tokens）...\n{text[-keep:]}"
+
+def summarize_step(action, observation, width=120):
+    """
+    One line standing for an old step: the tool, its input and the first line of its result.
+    """
+    tool_input = " ".join(str(action.tool_input).split())
+    first_line = next((line.strip() for line in str(observation).splitlines() if line.strip()), "")
+    return f"- {action.tool}({tool_input[:width]}) -> {first_line[:width]}"
+
+def compact_scratchpad(intermediate_steps, max_tokens=SCRATCHPAD_TOKENS, observation_tokens=OBSERVATION_TOKENS, keep_recent=KEEP_RECENT_STEPS):
+    """
+    The `agent_scratchpad` of the ReAct prompt within `max_tokens`: observations are truncated,
+    then the oldest steps are replaced by one-line summaries, then the oldest summaries are dropped.
+    """
+    steps = [
+        f"{action.log}\nObservation: {truncate_text(observation, observation_tokens)}\nThought: "
+        for action, observation in intermediate_steps
+    ]
+    summaries = [summarize_step(action, observation) for action, observation in intermediate_steps]
+    # Number of old steps written as a summary line rather than in full.
+    summarized = 0
+    while summarized < len(steps) - keep_recent and _total(steps, summaries, summarized) > max_tokens:
+        summarized += 1
+    # Number of the oldest summary lines dropped altogether.
+    dropped = 0
+    while dropped < summarized and _total(steps, summaries, summarized, dropped) > max_tokens:
+        dropped += 1
+    return _render(steps, summaries, summarized, dropped)
+
+def _render(steps, summaries, summarized, dropped=0):
+    if not summarized:
+        return "".join(steps)
+    lines = [f"（之前的 {dropped} 步已省略）"] if dropped else []
+    lines += summaries[dropped:summarized]
+    header = "之前步骤的摘要：\n" + "\n".join(lines) + "\nThought: "
+    return header + "".join(steps[summarized:])
+
+def _total(steps, summaries, summarized, dropped=0):
+    return estimate_tokens(_render(steps, summaries, summarized, dropped))
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import threading
+from src.atomic import tmp_path_for
+
+# Books converted from json on first access: the jobs asking for the same book at the same time wait for one conversion.
+_convert_lock = threading.Lock()
+
+
+def store_paths(books_dir, dir_name):
+    """
+    Paths of the section store of a book: one section per line, and the title -> [offset, length] index.
+    """
+    jsonl_path = os.path.join(books_dir, f"{dir_name}.jsonl")
+    index_path = os.path.join(books_dir, f"{dir_name}.index.json")
+    return jsonl_path, index_path
+
+
+class SectionWriter:
+    """
+    Append the sections of a book one by one, never rewriting what was already written.
+    The store is written next to the final files and only replaces them in `close`,
+    so a crash during ingestion leaves the previous store untouched. The store and its index are replaced
+    one after the other: a reader may meet the index of the other version, which `read_section` detects.
+    """
+    def __init__(self, books_dir, dir_name):
+        self.jsonl_path, self.index_path = store_paths(books_dir, dir_name)
+        self.index = {}
+        self.offset = 0
+        # Unique temporary names, so concurrent writers of the same book never truncate each other's files.
+        self.jsonl_tmp_path = tmp_path_for(self.jsonl_path)
+        self.index_tmp_path = tmp_path_for(self.index_path)
+        self.file = open(self.jsonl_tmp_path, "wb")
+
+    def append(self, title, text):
+        line = (json.dumps({"title": title, "text": text}, ensure_ascii=False) + "\n").encode("utf-8")
+        self.file.write(line)
+        self.file.flush()
+        # Keep the first section with a given title, like the former scans over the json did.
+        self.index.setdefault(title, [self.offset, len(line)])
+        self.offset += len(line)
+
+    def close(self):
+        self.file.close()
+        with open(self.index_tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(self.jsonl_tmp_path, self.jsonl_path)
+        os.replace(self.index_tmp_path, self.index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.jsonl_tmp_path)
+
+
+def build_index(jsonl_path):
+    """
+    Rebuild the index by scanning the store, used when the sidecar index is missing.
+    """
+    with open(jsonl_path, "rb") as f:
+        return _scan(f)
+
+
+def _scan(f):
+    index = {}
+    offset = 0
+    for line in f:
+        if line.strip():
+            index.setdefault(json.loads(line)["title"], [offset, len(line)])
+        offset += len(line)
+    return index
+
+
+def _read_record(f, entry):
+    """
+    The record at the [offset, length] `entry` of the index, or None if there is no valid record there.
+    """
+    offset, length = entry
+    f.seek(offset)
+    try:
+        record = json.loads(f.read(length))
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def convert_json_to_store(books_dir, dir_name):
+    """
+    Convert a book stored as a single json list (`<dir_name>.json`) into the section store.
+    """
+    json_path = os.path.join(books_dir, f"{dir_name}.json")
+    with open(json_path, "r", encoding="utf-8") as f:
+        sections = json.load(f)
+    with SectionWriter(books_dir, dir_name) as writer:
+        for item in sections:
+            writer.append(item.get("title", ""), item.get("text", ""))
+
+
+def read_index(books_dir, dir_name):
+    """
+    Load the title -> [offset, length] index of a book.
+    Books that were only stored as json are converted on first access.
+    """
+    jsonl_path, index_path = store_paths(books_dir, dir_name)
+    if not os.path.exists(jsonl_path):
+        with _convert_lock:
+            # Another job may have converted the book while this one was waiting.
+            if not os.path.exists(jsonl_path):
+                if not os.path.exists(os.path.join(books_dir, f"{dir_name}.json")):
+                    raise FileNotFoundError(f"No section store found in {books_dir}")
+                convert_json_to_store(books_dir, dir_name)
+    if not os.path.exists(index_path):
+        return build_index(jsonl_path)
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_section(books_dir, dir_name, title, index=None):
+    """
+    Seek straight to one section of the store and return its text ("" if the title is unknown).
+    An index that doesn't match the store (the book was re-ingested meanwhile) is rebuilt from the store.
+    """
+    if index is None:
+        index = read_index(books_dir, dir_name)
+    if title not in index:
+        return ""
+    jsonl_path, _ = store_paths(books_dir, dir_name)
+    with open(jsonl_path, "rb") as f:
+        record = _read_record(f, index[title])
+        if record is None or record.get("title") != title:
+            # The book was stored again between reading the index and opening the store: the index is the one
+            # of the other version. Index the file that is open instead.
+            f.seek(0)
+            index = _scan(f)
+            if title not in index:
+                return ""
+            record = _read_record(f, index[title]) or {}
+    return record.get("text", "")
+
+
+if __name__ == "__main__":
+    # Convert existing books, e.g. `python -m src.section_store book1`.
+    base_books_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "books"))
+    for dir_name in sys.argv[1:]:
+        convert_json_to_store(os.path.join(base_books_dir, dir_name), dir_name)
+        print(f"Converted {dir_name}.")
@@ -0,0 +1,102 @@
+import re
+import difflib
+import threading
+
+# A local match is trusted when its score reaches the threshold and beats the runner-up by the margin.
+MATCH_THRESHOLD = 0.6
+MATCH_MARGIN = 0.1
+# Below this score, the closest title is no match at all.
+MATCH_FLOOR = 0.3
+
+# (dir_name, user title, titles of the book) -> resolved title
+_resolved = {}
+_resolved_lock = threading.Lock()
+
+
+def normalize_title(title):
+    """
+    Lower case the title and drop spaces and punctuation, which carry no meaning for the match.
+    """
+    return re.sub(r"[\s\W_]+", "", title.lower())
+
+def strip_numbering(title):
+    """
+    Drop the numbering in front of a title, e.g. "II-2 粘弹性" -> "粘弹性".
+    """
+    return re.sub(r"^[A-Za-z0-9]+(?:[-.&][A-Za-z0-9]+)*\s+", "", title.strip())
+
+def char_ngrams(text, n=2):
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def title_score(user_title, title):
+    """
+    Similarity in [0, 1] between the user title and a title of the book.
+    Works on characters, so Chinese titles need no word segmentation.
+    """
+    query = normalize_title(user_title)
+    best = 0.0
+    for candidate in {normalize_title(title), normalize_title(strip_numbering(title))}:
+        if not query or not candidate:
+            continue
+        if query == candidate:
+            return 1.0
+        # Character bigram Dice coefficient.
+        query_grams, candidate_grams = char_ngrams(query), char_ngrams(candidate)
+        dice = 2 * len(query_grams & candidate_grams) / (len(query_grams) + len(candidate_grams))
+        # Edit distance based ratio.
+        ratio = difflib.SequenceMatcher(None, query, candidate).ratio()
+        score = max(dice, ratio)
+        # "测量摩擦系数" contains "摩擦系数": a strong hint, scaled by how much of the longer one is covered.
+        shorter, longer = sorted((query, candidate), key=len)
+        if shorter in longer:
+            score = max(score, 0.6 + 0.4 * len(shorter) / len(longer))
+        best = max(best, score)
+    return best
+
+def rank_titles(user_title, titles):
+    """
+    Titles of the book sorted from the best to the worst match, as (score, title) pairs.
+    """
+    return sorted(((title_score(user_title, title), title) for title in titles), key=lambda pair: -pair[0])
+
+def match_title(answer, titles):
+    """
+    Map a free text answer onto one of the titles: exact match, then substring match, then the closest title.
+    Returns "" for an empty answer, or when even the closest title scores below `MATCH_FLOOR`.
+    """
+    answer = (answer or "").strip()
+    if not normalize_title(answer):
+        return ""
+    for title in titles:
+        if title.lower() == answer.lower():
+            return title
+    for title in titles:
+        if answer.lower() in title.lower():
+            return title
+    ranked = rank_titles(answer, titles)
+    return ranked[0][1] if ranked and ranked[0][0] >= MATCH_FLOOR else ""
+
+def resolve_title(dir_name, user_title, titles, llm_match):
+    """
+    Find the title of the book the user means.
+    The local matcher answers when it is confident; `llm_match(user_title, titles)` is only
+    called when the match is ambiguous. Results are memoized per (book, user title).
+    """
+    key = (dir_name, user_title, tuple(titles))
+    with _resolved_lock:
+        if key in _resolved:
+            return _resolved[key]
+    ranked = rank_titles(user_title, titles)
+    if not ranked:
+        return ""
+    best_score, best_title = ranked[0]
+    second_score = ranked[1][0] if len(ranked) > 1 else 0.0
+    if best_score >= MATCH_THRESHOLD and best_score - second_score >= MATCH_MARGIN:
+        title = best_title
+    else:
+        title = match_title(llm_match(user_title, titles), titles)
+    with _resolved_lock:
+        _resolved[key] = title
+    return title
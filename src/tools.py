@@ -1,44 +1,107 @@
 import os
-import matplotlib.font_manager
+import shutil
 from langchain.agents import tool, Tool
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.font_manager import FontProperties
-import matplotlib
 import json
-from matplotlib.table import Table
+from src.frames import LazyFrames
+from src.profiling import profile_dataframe, fingerprint
+from src.sandbox import SandboxExecutor
+from src.latex_tables import dataframe_to_latex
+from src.rendering import render, render_many
+
+def fit_polynomial(x, Y, degree=1, sigma=None, full_residuals=False):
+    """
+    Least squares fits of a polynomial of `degree` in `x` to every column of `Y`, in one `np.linalg.lstsq` call.
+    With `sigma` (uncertainties of the y values) the fit is weighted by 1/sigma^2 and the standard errors
+    treat sigma as absolute; without it they are scaled by the residual variance.
+    Returns one dict per column: coefficients (highest power first, as `np.polyfit`), standard errors,
+    R^2, residuals and the reduced chi^2 for weighted fits. The residuals are summarized as their number,
+    RMS and largest absolute value, unless `full_residuals` asks for all of them (one per data point).
+    """
+    x = np.asarray(x, dtype=float)
+    Y = np.asarray(Y, dtype=float).reshape(len(x), -1)
+    n, p = len(x), degree + 1
+    if n <= p:
+        raise ValueError(f"{n} points are not enough for a polynomial of degree {degree}.")
+    A = np.vander(x, p)
+    w = np.ones(n) if sigma is None else 1 / np.asarray(sigma, dtype=float)
+    coefficients, _, rank, _ = np.linalg.lstsq(A * w[:, None], Y * w[:, None], rcond=None)
+    if rank < p:
+        raise ValueError("The x values can't determine the fit (too few distinct values).")
+    residuals = Y - A @ coefficients
+    chi2 = np.sum((residuals * w[:, None]) ** 2, axis=0)
+    weighted_mean = np.sum(Y * (w ** 2)[:, None], axis=0) / np.sum(w ** 2)
+    ss_tot = np.sum(((Y - weighted_mean) * w[:, None]) ** 2, axis=0)
+    r2 = 1 - chi2 / np.where(ss_tot == 0, np.nan, ss_tot)
+    unscaled = np.linalg.inv((A * w[:, None]).T @ (A * w[:, None]))
+    scale = np.ones_like(chi2) if sigma is not None else chi2 / (n - p)
+    std_errors = np.sqrt(np.outer(np.diag(unscaled), scale))
+    results = []
+    for j in range(Y.shape[1]):
+        result = {
+            "coefficients": coefficients[:, j].tolist(),
+            "std_errors": std_errors[:, j].tolist(),
+            "r2": float(r2[j]),
+            "residuals": residuals[:, j].tolist() if full_residuals else {
+                "n": n,
+                "rms": float(np.sqrt(np.mean(residuals[:, j] ** 2))),
+                "max_abs": float(np.max(np.abs(residuals[:, j]))),
+            },
+        }
+        if sigma is not None:
+            result["reduced_chi2"] = float(chi2[j] / (n - p))
+        results.append(result)
+    return results
 
 # data processing
 def data_tool_factory(cfg):
     
     csv_files = [f for f in os.listdir(cfg.data_dir) if f.endswith('.csv')]
     df_names = [f[:-4] for f in csv_files]  # Remove '.csv' extension for names
-    dfs = {}
-    for i, file in enumerate(csv_files):
-        file_path = os.path.join(cfg.data_dir, file)
-        df = pd.read_csv(file_path)
-        dfs[df_names[i]] = df
+    # The dataframes are only parsed when the agent first uses them.
+    dfs = LazyFrames({df_names[i]: os.path.join(cfg.data_dir, file) for i, file in enumerate(csv_files)})
 
-    matplotlib.font_manager.fontManager.addfont("NotoSerifSC-Regular.ttf")
-    matplotlib.rcParams['font.family'] = 'sans-serif'
-    font_prop = FontProperties(fname="NotoSerifSC-Regular.ttf")
-    plt.rcParams['font.sans-serif'] = [font_prop.get_name()]
-    matplotlib.rcParams['axes.unicode_minus'] = False
-
-    matplotlib.use('Agg')  # Use non-interactive backend for plotting
-    
     state = {"log": "", "figures": [], "tables": []}
+    # The queries of `data_processor` run in a worker process of this job, never in the server itself.
+    sandbox = SandboxExecutor(timeout=cfg.sandbox_timeout, memory_mb=cfg.sandbox_memory_mb) if cfg.sandbox else None
+    # df_name -> (fingerprint, profile), computed once per version of each dataframe.
+    profiles = {}
+
+    def get_profile(df_name):
+        df = dfs[df_name]
+        key = fingerprint(df)
+        if df_name not in profiles or profiles[df_name][0] != key:
+            profiles[df_name] = (key, profile_dataframe(df, df_name))
+        return profiles[df_name][1]
+
+    def refresh_profiles():
+        # Bring the profiles of the dataframes a query changed up to date.
+        for df_name in list(profiles):
+            if df_name not in dfs or not dfs.is_loaded(df_name):
+                del profiles[df_name]
+            else:
+                get_profile(df_name)
 
     # data processor
     @tool
     def data_accessor(df_name: str) -> str:
         """
         View dataframe structures, only show header and first 3 rows. Input is name of a dataframe or 'all' to access all dataframes.
+        Input 'profile:<name>' or 'profile:all' instead to get the profile of dataframes: shape, dtypes, units,
+        null counts, min/max/mean and monotonic (likely independent) columns.
         Don't include quotes around the name.
         """
         print(f"Accessing dataframe: {df_name}")
         df_name = df_name.strip()
+        if df_name.startswith("profile:"):
+            df_name = df_name[len("profile:"):].strip()
+            if df_name == "all":
+                return "\n".join(get_profile(name) for name in dfs)
+            elif df_name in dfs:
+                return get_profile(df_name)
+            else:
+                return f"Invalid name. Name should be in {list(dfs)} or 'all'."
         if df_name == "all":
             all_data = "\n".join([f"{name}:\n{str(df[:3])}" for name, df in dfs.items()])
             return all_data
@@ -59,6 +122,10 @@ def data_tool_factory(cfg):
         """
         query = query.strip()
         print(f"Executing query: {query}")
+        if sandbox is not None:
+            error = sandbox.execute(query, dfs)
+            refresh_profiles()
+            return error or "Query executed successfully."
         local_vars = {
             "dfs": dfs,
             "np": np,
@@ -69,19 +136,25 @@ def data_tool_factory(cfg):
             return "Query executed successfully."
         except Exception as e:
             return f"Exception occurs: {str(e)}"
+        finally:
+            refresh_profiles()
 
     def data_saver():
         processed_path = os.path.join(cfg.data_dir, "processed")
         os.makedirs(processed_path, exist_ok=True)
         for df_name in df_names:
             file_path = os.path.join(processed_path, f"{df_name}_processed.csv")
-            dfs[df_name].to_csv(file_path, index=False)
+            if dfs.is_loaded(df_name):
+                dfs[df_name].to_csv(file_path, index=False)
+            else:
+                # Never used by the agent, so it is unchanged.
+                shutil.copyfile(dfs.paths[df_name], file_path)
 
     # Plot tool
     @tool()
     def plot_curve(query: str) -> str:
         """
-        Plot a curve using two columns from a dataframe and save it as a PNG file.
+        Plot a curve using two columns from a dataframe and save it as a figure file.
 
         Parameters are in a dict format, with double quotes around the names:
         {
@@ -110,18 +183,17 @@ def data_tool_factory(cfg):
             if x not in dfs[df_name].columns or y not in dfs[df_name].columns:
                 return f"Invalid column names: {x}, {y}. Please check the dataframe."
             
-            plt.figure(figsize=(10, 6))
-            plt.plot(dfs[df_name][x], dfs[df_name][y], marker='o')
-            plt.xlabel(x)
-            plt.ylabel(y, rotation=0)
-            plt.title(title)
-            plt.grid()
+            file_path = os.path.join(cfg.plots_dir, f"{name}.{cfg.figure_format}")
+            render(
+                "curve",
+                {"xlabel": x, "ylabel": y, "title": title},
+                {"x": dfs[df_name][x].to_numpy(), "y": dfs[df_name][y].to_numpy()},
+                file_path,
+                fmt=cfg.figure_format,
+            )
 
-            os.makedirs('plots', exist_ok=True)
-            file_path = os.path.join('plots', f"{name}.png")
-            plt.savefig(file_path)
-            plt.close()
-            
+            # Paths are given relative to the workspace, where the report is compiled.
+            file_path = os.path.relpath(file_path, cfg.workspace)
             state['figures'].append(file_path)
             return f"Plot saved as {file_path}"
         except Exception as e:
@@ -130,7 +202,7 @@ def data_tool_factory(cfg):
     @tool()
     def plot_least_squares(query: str) -> str:
         """
-        Plot a least squares line using two columns from a dataframe and save it as a PNG file.
+        Plot a least squares line using two columns from a dataframe and save it as a figure file.
 
         Parameters are in a dict format, with double quotes around the names:
         {
@@ -169,25 +241,81 @@ def data_tool_factory(cfg):
             x_line = np.linspace(x_min - 0.1 * x_range, x_max + 0.1 * x_range, 100)
             y_line = slope * x_line + intercept
 
-            plt.figure(figsize=(10, 6))
-            plt.plot(x_vals, y_vals, 'o')
-            plt.plot(x_line, y_line, 'r-')
-            plt.xlabel(x)
-            plt.ylabel(y, rotation=0)
-            plt.title(title)
-            plt.grid()
-
-            os.makedirs('plots', exist_ok=True)
-            file_path = os.path.join('plots', f"{name}.png")
-            plt.savefig(file_path)
-            plt.close()
+            file_path = os.path.join(cfg.plots_dir, f"{name}.{cfg.figure_format}")
+            render(
+                "least_squares",
+                {"xlabel": x, "ylabel": y, "title": title},
+                {"x": x_vals, "y": y_vals, "line_x": x_line, "line_y": y_line},
+                file_path,
+                fmt=cfg.figure_format,
+            )
 
+            file_path = os.path.relpath(file_path, cfg.workspace)
             state['figures'].append(file_path)
             return f"Plot saved as {file_path}. Slope: {slope}, Intercept: {intercept}"
         
         except Exception as e:
             return f"Exception occurs: {str(e)}"
 
+    @tool()
+    def fit_series(query: str) -> str:
+        """
+        Least squares polynomial fits of several series in one call, optionally weighted by an uncertainty column.
+
+        Parameters are in a dict format, with double quotes around the names:
+        {
+            "series": [ # the series to fit
+                {"df_name": # name of the dataframe, "x": # column of x, "y": # column of y,
+                 "y_err": # (optional) column of the uncertainties of y, "degree": # (optional) degree for this series}
+            ],
+            "degree": # degree of the polynomial, 1 (straight line) by default,
+            "residuals": # (optional) true to get every residual, only their number, RMS and max |r| by default
+        }
+
+        Returns, for each series: coefficients from the highest power down (slope then intercept for a line),
+        their standard errors, R^2, residuals and the reduced chi^2 of weighted fits.
+        """
+        try:
+            query_dict = json.loads(query.strip())
+            default_degree = int(query_dict.get("degree", 1))
+            full_residuals = bool(query_dict.get("residuals", False))
+            series = query_dict.get("series") or []
+            results = [None] * len(series)
+            # Series sharing dataframe, x, uncertainties and degree are fitted together.
+            groups = {}
+            for i, item in enumerate(series):
+                df_name, x, y, y_err = item.get("df_name"), item.get("x"), item.get("y"), item.get("y_err")
+                if df_name not in dfs:
+                    results[i] = {"error": f"Invalid dataframe name: {df_name}. Available dataframes are: {list(dfs)}."}
+                    continue
+                missing = [column for column in (x, y, y_err) if column is not None and column not in dfs[df_name].columns]
+                if missing or x is None or y is None:
+                    results[i] = {"error": f"Invalid column names: {missing or [x, y]}. Please check the dataframe."}
+                    continue
+                degree = int(item.get("degree", default_degree))
+                # Series with missing values are fitted on their own rows only.
+                columns = [column for column in (x, y, y_err) if column is not None]
+                alone = bool(dfs[df_name][columns].isna().to_numpy().any())
+                groups.setdefault((df_name, x, y_err, degree, i if alone else None), []).append((i, y))
+            for (df_name, x, y_err, degree, _), members in groups.items():
+                columns = [x, y_err] + [y for _, y in members] if y_err else [x] + [y for _, y in members]
+                data = dfs[df_name][list(dict.fromkeys(columns))].dropna()
+                try:
+                    fits = fit_polynomial(
+                        data[x].to_numpy(dtype=float),
+                        data[[y for _, y in members]].to_numpy(dtype=float),
+                        degree,
+                        data[y_err].to_numpy(dtype=float) if y_err else None,
+                        full_residuals,
+                    )
+                except (ValueError, np.linalg.LinAlgError) as e:
+                    fits = [{"error": str(e)}] * len(members)
+                for (i, y), fit in zip(members, fits):
+                    results[i] = {"df_name": df_name, "x": x, "y": y, "degree": degree, **fit}
+            return json.dumps(results, ensure_ascii=False, default=float)
+        except Exception as e:
+            return f"Exception occurs: {str(e)}"
+
     # log writer
     @tool
     def write_log(content: str) -> str:
@@ -206,69 +334,26 @@ def data_tool_factory(cfg):
         return state['log']
 
     def plot_tables():
+        os.makedirs(cfg.plots_dir, exist_ok=True)
+        images = []
         for df_name in df_names:
-            plot_table(dfs[df_name], f"plots/{df_name}_table.png")
-            state['tables'].append(f"plots/{df_name}_table.png")
+            if cfg.table_backend == "latex":
+                # LaTeX code of the table, included in the report with \input.
+                file_path = os.path.join(cfg.plots_dir, f"{df_name}_table.tex")
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(dataframe_to_latex(dfs[df_name], caption=df_name, label=f"tab:{df_name}", digits=cfg.table_digits))
+            else:
+                file_path = os.path.join(cfg.plots_dir, f"{df_name}_table.{cfg.figure_format}")
+                images.append(("table", {}, {"df": dfs[df_name]}, file_path))
+            state['tables'].append(os.path.relpath(file_path, cfg.workspace))
+        # The table images are rendered side by side.
+        render_many(images, fmt=cfg.figure_format)
         return ", ".join(state['tables'])
 
-    def plot_table(df: pd.DataFrame, file_path: str):
-        # Create figure with dynamic size based on DataFrame dimensions
-        nrows, ncols = df.shape
-        fig_height = max(4, nrows * 0.4)  # Minimum 4 inches, 0.4" per row
-        fig_width = max(6, ncols * 1.2)   # Minimum 6 inches, 1.2" per column
-        
-        fig, ax = plt.subplots(figsize=(fig_width, fig_height))
-        ax.axis('off')
-        
-        # Prepare table data (include headers)
-        cell_text = [df.columns.tolist()] + df.values.tolist()
-        
-        # Create table with auto-scaling
-        table = ax.table(
-            cellText=cell_text,
-            loc='center',
-            cellLoc='left',
-            colLoc='left'
-        )
-        
-        # Style adjustments
-        table.auto_set_font_size(False)
-        table.set_fontsize(10)
-        table.scale(1, 1.5)  # Scale row height
-        
-        # Header row styling
-        for i in range(ncols):
-            table[(0, i)].set_facecolor("#FFFFFF")
-            table[(0, i)].set_text_props(color='black', weight='bold')
-        
-        # Alternate row coloring
-        for i in range(1, len(cell_text)):
-            color = "#f0f0f0" if i % 2 == 0 else '#ffffff'
-            for j in range(ncols):
-                table[(i, j)].set_facecolor(color)
-        
-        # Save and close
-        plt.savefig(file_path, bbox_inches='tight', dpi=400)
-        plt.close(fig)
+    def close():
+        # Stop the worker process of the job.
+        if sandbox is not None:
+            sandbox.close()
 
-    # latex writer
-    # @tool
-    def write_latex(content: str) -> str:
-        """
-        Write you LaTeX code here for the experiment report, including tables of raw data and figures.
-        Only include part of the code corresponding to the sections you need to write.
-        Don't use quotes around the code.
-        Format:
-
-        \section{实验数据处理}
-        your code
-        \section{分析讨论}
-        your code
-        """
-        os.makedirs("tmp", exist_ok=True)
-        with open("tmp/output.txt", "a") as f:
-            f.write(content + "\n")
-        return "Content successfully written! Your job is done."
-    
-    tools = [data_accessor, data_processor, plot_curve, plot_least_squares, write_log]
-    return tools, data_saver, get_figures, get_log, plot_tables, write_latex
+    tools = [data_accessor, data_processor, plot_curve, plot_least_squares, fit_series, write_log]
+    return tools, data_saver, get_figures, get_log, plot_tables, close
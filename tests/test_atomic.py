@@ -0,0 +1,52 @@
+import os
+import threading
+import pytest
+from src.atomic import atomic_path
+
+
+def test_file_is_replaced_when_the_block_succeeds(tmp_path):
+    path = tmp_path / "artifacts.json"
+    path.write_text("old")
+    with atomic_path(str(path)) as tmp:
+        with open(tmp, "w") as f:
+            f.write("new")
+        assert path.read_text() == "old"
+    assert path.read_text() == "new"
+    assert os.listdir(tmp_path) == ["artifacts.json"]
+
+
+def test_file_is_kept_when_the_block_fails(tmp_path):
+    path = tmp_path / "artifacts.json"
+    path.write_text("old")
+    with pytest.raises(RuntimeError):
+        with atomic_path(str(path)) as tmp:
+            with open(tmp, "w") as f:
+                f.write("half")
+            raise RuntimeError("crash")
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["artifacts.json"]
+
+
+def test_concurrent_writers_never_share_a_temporary_file(tmp_path):
+    path = str(tmp_path / "artifacts.json")
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def write(i):
+        try:
+            with atomic_path(path) as tmp:
+                with open(tmp, "w") as f:
+                    f.write("x" * 1000)
+                    barrier.wait(5)
+                    f.write(str(i))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    content = open(path).read()
+    assert len(content) == 1001 and content[:1000] == "x" * 1000
@@ -0,0 +1,57 @@
+import os
+import uuid
+import time
+import random
+from src import book_agent
+
+
+def fake_convert_from_path(pdf_path, first_page, last_page, output_folder, fmt, paths_only, thread_count):
+    # Like pdftoppm with several threads: every thread writes under its own random prefix,
+    # the returned list being in page order.
+    paths = []
+    for page in range(first_page, last_page + 1):
+        path = os.path.join(output_folder, f"{uuid.uuid4()}-{page:02d}.jpg")
+        with open(path, "wb") as f:
+            f.write(f"page {page}".encode())
+        paths.append(path)
+    return paths
+
+
+def test_iter_page_images_keeps_page_order_with_threads(monkeypatch):
+    monkeypatch.setattr(book_agent, "pdfinfo_from_path", lambda pdf_path: {"Pages": 10})
+    monkeypatch.setattr(book_agent, "convert_from_path", fake_convert_from_path)
+    pages = list(book_agent.iter_page_images("book.pdf", window_size=4, thread_count=4))
+    assert pages == [f"page {page}".encode() for page in range(1, 11)]
+
+
+class ListWriter:
+    def __init__(self):
+        self.sections = []
+
+    def append(self, title, text):
+        self.sections.append((title, text))
+
+
+def test_concurrent_analysis_gives_the_same_sections_as_the_serial_one(monkeypatch):
+    # Every fifth page starts a section, the pages finish in a random order.
+    rng = random.Random(0)
+    delays = {}
+
+    def fake_analyze_page(image_bytes, vl_model_name, client, combined=True, cache_dir=None):
+        page = int(image_bytes.decode().split()[1])
+        time.sleep(delays.setdefault(page, rng.uniform(0, 0.02)))
+        is_new_section = page % 5 == 0
+        return {"text": f"第{page}页。", "is_new_section": is_new_section, "title": f"实验{page // 5}" if is_new_section else None}
+
+    monkeypatch.setattr(book_agent, "analyze_page", fake_analyze_page)
+    images = [f"page {page}".encode() for page in range(40)]
+    results = {}
+    for max_workers in (1, 4):
+        writer = ListWriter()
+        pages = list(book_agent.analyze_pages(iter(images), "vl", None, max_workers=max_workers))
+        assert [page["text"] for page in pages] == [f"第{page}页。" for page in range(40)]
+        book_agent.write_sections(iter(pages), writer)
+        results[max_workers] = writer.sections
+    assert results[4] == results[1]
+    assert len(results[1]) == 8
+    assert results[1][1] == ("实验1", "".join(f"第{page}页。" for page in range(5, 10)))
@@ -0,0 +1,29 @@
+from src.chunking import split_markdown, estimate_tokens
+
+
+def test_short_text_is_one_chunk():
+    text = "# 实验目的\n测量弹簧的劲度系数。\n## 仪器\n弹簧、砝码。"
+    assert split_markdown(text, max_tokens=1000) == [text]
+
+
+def test_chunks_are_cut_on_headings_within_the_budget():
+    sections = [f"## 第{i}节\n" + "内容" * 40 for i in range(6)]
+    text = "\n".join(sections)
+    chunks = split_markdown(text, max_tokens=200)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+    assert all(chunk.startswith("## ") for chunk in chunks)
+    assert "\n".join(chunks) == text
+
+
+def test_section_longer_than_the_budget_is_split_on_paragraphs():
+    text = "# 原理\n" + "\n\n".join("段落" * 50 for _ in range(5))
+    chunks = split_markdown(text, max_tokens=150)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 150 for chunk in chunks)
+
+
+def test_single_huge_line_is_cut_by_characters():
+    chunks = split_markdown("字" * 1000, max_tokens=100)
+    assert "".join(chunks) == "字" * 1000
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
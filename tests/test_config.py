@@ -0,0 +1,35 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+from src.config import CFG
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_report_settings_come_from_the_environment():
+    script = (
+        "import json\n"
+        "from src.config import CFG\n"
+        "cfg = CFG('t', 'book', 'm', 'none', 'p', workspace='w')\n"
+        "print(json.dumps([cfg.agent_executor, cfg.table_backend, cfg.figure_format, cfg.sandbox, cfg.sandbox_timeout, cfg.sandbox_memory_mb]))\n"
+    )
+    env = {
+        **os.environ,
+        "LABOTEX_AGENT_EXECUTOR": "tools",
+        "LABOTEX_TABLE_BACKEND": "image",
+        "LABOTEX_FIGURE_FORMAT": "png",
+        "LABOTEX_SANDBOX": "0",
+        "LABOTEX_SANDBOX_TIMEOUT": "30",
+        "LABOTEX_SANDBOX_MEMORY_MB": "512",
+    }
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True, check=True)
+    assert json.loads(result.stdout) == ["tools", "image", "png", False, 30, 512]
+
+
+def test_unknown_settings_are_rejected():
+    with pytest.raises(ValueError, match="agent_executor"):
+        CFG("t", "book", "m", "none", "p", agent_executor="tool", workspace="w")
+    with pytest.raises(ValueError, match="figure_format"):
+        CFG("t", "book", "m", "none", "p", figure_format="svg", workspace="w")
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from src.tools import fit_polynomial
+
+
+def test_matches_polyfit_for_every_column():
+    x = np.linspace(0, 5, 12)
+    rng = np.random.default_rng(0)
+    Y = np.column_stack([2 * x + 1, 0.5 * x ** 2 - x]) + rng.normal(0, 0.1, (12, 2))
+    results = fit_polynomial(x, Y, degree=2)
+    assert len(results) == 2
+    for j, result in enumerate(results):
+        coefficients, covariance = np.polyfit(x, Y[:, j], 2, cov=True)
+        assert np.allclose(result["coefficients"], coefficients)
+        assert np.allclose(result["std_errors"], np.sqrt(np.diag(covariance)))
+        assert 0.9 < result["r2"] <= 1
+        assert "reduced_chi2" not in result
+
+
+def test_weighted_fit_uses_absolute_sigma():
+    x = np.arange(6.0)
+    y = 3 * x - 2 + np.array([0.1, -0.1, 0.05, -0.05, 0.1, -0.1])
+    sigma = np.full(6, 0.1)
+    (result,) = fit_polynomial(x, y, sigma=sigma, full_residuals=True)
+    coefficients, covariance = np.polyfit(x, y, 1, w=1 / sigma, cov="unscaled")
+    assert np.allclose(result["coefficients"], coefficients)
+    assert np.allclose(result["std_errors"], np.sqrt(np.diag(covariance)))
+    assert result["reduced_chi2"] == pytest.approx(np.sum((np.array(result["residuals"]) / sigma) ** 2) / 4)
+
+
+def test_residuals_are_summarized_by_default():
+    x = np.arange(5.0)
+    y = 2 * x + np.array([0.1, -0.2, 0.0, 0.2, -0.1])
+    (full,) = fit_polynomial(x, y, full_residuals=True)
+    (summary,) = fit_polynomial(x, y)
+    residuals = np.array(full["residuals"])
+    assert len(residuals) == 5
+    assert summary["residuals"] == {
+        "n": 5,
+        "rms": pytest.approx(np.sqrt(np.mean(residuals ** 2))),
+        "max_abs": pytest.approx(np.max(np.abs(residuals))),
+    }
+
+
+def test_too_few_points_are_rejected():
+    with pytest.raises(ValueError):
+        fit_polynomial([1, 2], [1, 2], degree=1)
+    with pytest.raises(ValueError):
+        fit_polynomial([1, 1, 1, 1], [1, 2, 3, 4], degree=1)
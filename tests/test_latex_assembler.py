@@ -0,0 +1,63 @@
+from src.latex_assembler import markdown_to_latex, clean_section, split_fragments, render_document
+
+
+def test_markdown_headings_bold_and_lists():
+    code = "## 原理\n本实验用**胡克定律**。\n- 弹簧\n- 砝码\n1. 挂上砝码\n2. 读数"
+    assert markdown_to_latex(code) == "\n".join([
+        r"\subsection{原理}",
+        r"本实验用\textbf{胡克定律}。",
+        r"\begin{itemize}", r"\item 弹簧", r"\item 砝码", r"\end{itemize}",
+        r"\begin{enumerate}", r"\item 挂上砝码", r"\item 读数", r"\end{enumerate}",
+    ])
+
+
+def test_lines_of_math_environments_are_not_lists():
+    code = "\n".join([
+        r"\begin{align}",
+        r"m\ddot{x} &= -kx",
+        r"- \gamma\dot{x} &= F_d",
+        r"\end{align}",
+        r"\[",
+        r"- 1. \alpha",
+        r"\]",
+        r"$$",
+        r"* x",
+        r"$$",
+    ])
+    assert markdown_to_latex(code) == code
+
+
+def test_lists_resume_after_a_math_environment():
+    code = "\\begin{equation*}\n- a\n\\end{equation*}\n- 列表项\n行尾换行 \\\\[2pt]\n- 第二项"
+    assert markdown_to_latex(code).split("\n") == [
+        r"\begin{equation*}", "- a", r"\end{equation*}",
+        r"\begin{itemize}", r"\item 列表项", r"\end{itemize}",
+        r"行尾换行 \\[2pt]",
+        r"\begin{itemize}", r"\item 第二项", r"\end{itemize}",
+    ]
+
+
+def test_clean_section_strips_document_lines_and_pins_floats(tmp_path):
+    (tmp_path / "plots").mkdir()
+    (tmp_path / "plots" / "d_table.tex").write_text("\\begin{tabular}{c}\na \\\\\n\\end{tabular}\n", encoding="utf-8")
+    code = "```latex\n\\documentclass{ctexart}\n\\begin{document}\n\\section{数据}\n见图（见 plots/a.png）。\n\\begin{figure}[htbp]\n\\end{figure}\n\\input{plots/d_table.tex}\n\\end{document}\n```"
+    cleaned = clean_section(code, str(tmp_path))
+    assert "documentclass" not in cleaned and "begin{document}" not in cleaned and "```" not in cleaned
+    assert "\\begin{figure}[H]" in cleaned
+    assert "见图。" in cleaned
+    assert "\\begin{tabular}{c}" in cleaned and "\\input" not in cleaned
+
+
+def test_split_fragments_never_cuts_an_environment():
+    code = "第一段\n\n\\begin{figure}[H]\n\\centering\n\n\\includegraphics{a.pdf}\n\\end{figure}\n\n第三段"
+    assert split_fragments(code) == ["第一段", "\\begin{figure}[H]\n\\centering\n\n\\includegraphics{a.pdf}\n\\end{figure}", "第三段"]
+
+
+def test_render_document_spans_point_at_the_fragments():
+    fragments = ["\\section{a}\n正文", "第二段"]
+    source, spans = render_document(fragments, "实验_1")
+    lines = source.split("\n")
+    for fragment, (start, end) in zip(fragments, spans):
+        assert "\n".join(lines[start - 1:end]) == fragment
+    assert "\\title{实验\\_1}" in source
+    assert source.rstrip().endswith("\\end{document}")
@@ -0,0 +1,63 @@
+import os
+import sys
+from src.latex_build import parse_errors, compile_latex
+
+LOG = r"""This is XeTeX, Version 3.141592653
+(./report.tex
+! Undefined control sequence.
+l.42 \foo
+         {bar}
+! Missing $ inserted.
+<inserted text>
+                $
+l.57 x^
+       2
+! Emergency stop.
+<*> report.tex
+"""
+
+
+def test_errors_with_their_line_numbers():
+    assert parse_errors(LOG) == [
+        ("Undefined control sequence.", 42),
+        ("Missing $ inserted.", 57),
+        ("Emergency stop.", None),
+    ]
+
+
+def test_clean_log_has_no_errors():
+    assert parse_errors("Output written on report.pdf (3 pages).") == []
+
+
+FAKE_XELATEX = """#!{python}
+import os, sys
+out = next(arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("-output-directory="))
+job = os.path.splitext(sys.argv[-1])[0]
+with open(os.path.join(out, "passes"), "a") as f:
+    f.write("pass\\n")
+for ext, content in (("aux", "\\\\newlabel{{fig:1}}{{{{1}}{{2}}}}\\n"), ("log", "ok\\n"), ("pdf", "%PDF")):
+    with open(os.path.join(out, f"{{job}}.{{ext}}"), "w") as f:
+        f.write(content)
+"""
+
+
+def test_build_state_is_reused_by_the_next_job(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    xelatex = bin_dir / "xelatex"
+    xelatex.write_text(FAKE_XELATEX.format(python=sys.executable))
+    xelatex.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    tex_path = tmp_path / "report.tex"
+    tex_path.write_text("\\\\documentclass{article}")
+    cache_dir = tmp_path / "cache"
+
+    def passes(build_dir):
+        return len((build_dir / "passes").read_text().splitlines())
+
+    first, second = tmp_path / "job1", tmp_path / "job2"
+    compile_latex(str(tex_path), str(first), state_key="book-title", cache_dir=str(cache_dir))
+    assert passes(first) == 2
+    pdf_path = compile_latex(str(tex_path), str(second), state_key="book-title", cache_dir=str(cache_dir))
+    assert passes(second) == 1
+    assert pdf_path == os.path.join(str(second), "report.pdf")
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from src.latex_tables import dataframe_to_latex, format_column, escape_latex
+
+
+def test_special_characters_are_escaped():
+    assert escape_latex("a_b & 50% $x$") == r"a\_b \& 50\% \$x\$"
+
+
+def test_columns_are_formatted_as_a_whole():
+    assert list(format_column(pd.Series([1, 20, 300]))) == ["1", "20", "300"]
+    assert list(format_column(pd.Series([1.23456, 2.5, np.nan]), digits=3)) == ["1.23", "2.50", ""]
+    assert list(format_column(pd.Series([1.5e-5]))) == [r"$1.500\times10^{-5}$"]
+
+
+def test_floats_of_a_column_keep_their_trailing_zeros():
+    assert list(format_column(pd.Series([1.20, 1.25, 1.30, 2.0]))) == ["1.20", "1.25", "1.30", "2.00"]
+    assert list(format_column(pd.Series([0.1 + 0.2, 9.81]))) == ["0.30", "9.81"]
+    assert list(format_column(pd.Series([-1.5e-5, 3.25e-6]), digits=3)) == [r"$-1.50\times10^{-5}$", r"$3.25\times10^{-6}$"]
+
+
+def test_short_table_is_a_floating_tabular():
+    df = pd.DataFrame({"F_N": [1.0, 2.0], "x": [0.5, 1.0]})
+    code = dataframe_to_latex(df, caption="拉力与伸长量", label="tab:spring")
+    assert r"\begin{table}[H]" in code and r"\begin{tabular}{cc}" in code
+    assert r"\caption{拉力与伸长量}" in code and r"\label{tab:spring}" in code
+    assert r"F\_N & x \\" in code
+    assert r"1 & 0.5 \\" in code
+    assert "longtable" not in code
+
+
+def test_long_table_is_a_longtable_with_repeated_header():
+    df = pd.DataFrame({"t": range(40)})
+    code = dataframe_to_latex(df, longtable_rows=30)
+    assert code.startswith(r"\begin{longtable}{c}")
+    assert code.count(r"t \\") == 2
+    assert r"\endhead" in code and code.rstrip().endswith(r"\end{longtable}")
@@ -0,0 +1,44 @@
+import os
+import time
+from src.llm_cache import DiskCache, make_key
+
+
+def test_hits_and_misses_are_counted(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10 ** 6)
+    key = make_key("https://api.example.com", "model", [{"role": "user", "content": "你好"}], 0)
+    assert cache.get(key) is None
+    cache.set(key, "答案")
+    assert cache.get(key) == "答案"
+    assert cache.get(key) == "答案"
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_entries_survive_a_new_process(tmp_path):
+    DiskCache(str(tmp_path), max_bytes=10 ** 6).set("key", {"a": 1})
+    cache = DiskCache(str(tmp_path), max_bytes=10 ** 6)
+    assert cache.stats()["entries"] == 1
+    assert cache.get("key") == {"a": 1}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    for i in range(4):
+        cache.set(f"key{i}", "x" * 180)
+        # Distinct modification times, the oldest entry being key0.
+        os.utime(os.path.join(str(tmp_path), f"key{i}.json"), (time.time() - 100 + i, time.time() - 100 + i))
+    # A hit makes key0 the most recently used one.
+    assert cache.get("key0") is not None
+    cache.set("key4", "x" * 180)
+    cache.set("key5", "x" * 180)
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000
+    assert stats["bytes"] == sum(os.path.getsize(os.path.join(str(tmp_path), name)) for name in os.listdir(str(tmp_path)))
+    assert cache.get("key1") is None
+    assert cache.get("key0") is not None and cache.get("key5") is not None
+
+
+def test_nonzero_temperature_can_be_left_out(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000, cache_nonzero_temperature=False)
+    assert cache.should_cache(0) and cache.should_cache(None)
+    assert not cache.should_cache(0.7)
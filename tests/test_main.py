@@ -0,0 +1,23 @@
+import os
+import shutil
+import src.book_agent
+from src import main
+from src.config import ROOT_DIR
+from src.jobs import JobQueue
+
+
+def test_book_that_fails_to_load_fails_its_job(tmp_path, monkeypatch):
+    def pdf_to_json(cfg):
+        raise RuntimeError("no pdf in the book directory")
+
+    monkeypatch.setattr(src.book_agent, "pdf_to_json", pdf_to_json)
+    monkeypatch.setattr(main, "job_queue", JobQueue(max_workers=1))
+    dir_name = f"test-{tmp_path.name}"
+    try:
+        job_id = main.job_queue.submit("book", main.page_one_action, dir_name, "none", "", "", None, 1, "")
+        for status in main.wait_for_job(job_id):
+            pass
+    finally:
+        shutil.rmtree(os.path.join(ROOT_DIR, "books", dir_name), ignore_errors=True)
+    assert status["state"] == "failed"
+    assert "no pdf in the book directory" in status["error"]
@@ -0,0 +1,59 @@
+import json
+from src.book_agent import parse_page_analysis
+
+
+def test_latex_commands_looking_like_json_escapes_are_kept():
+    answer = r'{"text": "$\frac{1}{2} m v^2$，$\beta = \theta + \nu$，\left( x \right)，\tau", "is_new_section": false, "title": null}'
+    result = parse_page_analysis(answer)
+    assert result["text"] == r"$\frac{1}{2} m v^2$，$\beta = \theta + \nu$，\left( x \right)，\tau"
+
+
+def test_answer_whose_backslashes_all_look_like_escapes():
+    # Decodes without error as json, the commands must still not turn into control characters.
+    answer = r'{"text": "$\frac{1}{2}$ 和 $\beta$", "is_new_section": false, "title": null}'
+    assert parse_page_analysis(answer)["text"] == r"$\frac{1}{2}$ 和 $\beta$"
+
+
+def test_escaped_backslashes_and_newlines_are_decoded():
+    text = "第一行\n$\\frac{a}{b}$ 与 \\sigma"
+    answer = json.dumps({"text": text, "is_new_section": True, "title": "实验一"}, ensure_ascii=False)
+    assert parse_page_analysis(answer) == {"text": text, "is_new_section": True, "title": "实验一"}
+
+
+def test_unescaped_backslashes_are_repaired():
+    answer = '```json\n{"text": "$\\sigma = \\sqrt{x}$", "is_new_section": "true", "title": " 实验二 "}\n```'
+    assert parse_page_analysis(answer) == {"text": "$\\sigma = \\sqrt{x}$", "is_new_section": True, "title": "实验二"}
+
+
+def test_unknown_command_decoded_as_control_character_is_rejected():
+    # \bigstar is not in the list of known commands: json reads \b as a backspace.
+    answer = r'{"text": "$\bigstar$", "is_new_section": false, "title": null}'
+    assert parse_page_analysis(answer) is None
+
+
+def test_invalid_answers():
+    assert parse_page_analysis("not json") is None
+    assert parse_page_analysis('{"text": "x", "is_new_section": true, "title": ""}') is None
+    assert parse_page_analysis('{"text": 1, "is_new_section": false}') is None
+
+
+def test_text_after_the_delimiter_is_kept_as_is():
+    answer = '{"is_new_section": true, "title": "实验三 转动惯量"}\n===TEXT===\n# 实验三\n$\\frac{1}{2} I \\omega^2$，\\theta、\\nu 与 \\beta\r\n第二行\n'
+    assert parse_page_analysis(answer) == {
+        "text": "# 实验三\n$\\frac{1}{2} I \\omega^2$，\\theta、\\nu 与 \\beta\r\n第二行",
+        "is_new_section": True,
+        "title": "实验三 转动惯量",
+    }
+
+
+def test_fenced_answer_with_delimiter():
+    answer = '```\n{"is_new_section": false, "title": null}\n===TEXT===\n$\\sigma$\n```'
+    assert parse_page_analysis(answer) == {"text": "$\\sigma$", "is_new_section": False, "title": None}
+
+
+def test_valid_json_answers_come_back_unchanged():
+    # Tabs and line breaks followed by letters that would start \to, \tau, \ne or \nu.
+    for text in ["列1\to 列2", "a\tan b\tau", "第一行\ne\nu\ni", "Windows\r\n换行", "$\\frac{1}{2}$\n\\beta"]:
+        for is_new_section, title in ((False, None), (True, "实验四")):
+            answer = json.dumps({"text": text, "is_new_section": is_new_section, "title": title}, ensure_ascii=False)
+            assert parse_page_analysis(answer) == {"text": text, "is_new_section": is_new_section, "title": title}
@@ -0,0 +1,40 @@
+import time
+import threading
+import pytest
+from src.pipeline import TaskGraph
+
+
+def test_stages_run_after_their_dependencies():
+    order = []
+    graph = TaskGraph()
+    graph.add("a", lambda: order.append("a") or 1)
+    graph.add("b", lambda: order.append("b") or 2, deps=["a"])
+    graph.add("c", lambda: order.append("c") or 3, deps=["a", "b"])
+    assert graph.run() == {"a": 1, "b": 2, "c": 3}
+    assert order == ["a", "b", "c"]
+
+
+def test_failing_stage_stops_the_run_without_waiting():
+    release, agent_running = threading.Event(), threading.Event()
+    started = []
+
+    def agent():
+        agent_running.set()
+        release.wait(10)
+
+    def fail():
+        agent_running.wait(10)
+        raise RuntimeError("introduction failed")
+
+    graph = TaskGraph()
+    graph.add("introduction", fail)
+    graph.add("agent", agent)
+    graph.add("report", lambda: started.append("report"), deps=["introduction", "agent"])
+    start = time.perf_counter()
+    try:
+        with pytest.raises(RuntimeError, match="introduction failed"):
+            graph.run()
+        assert time.perf_counter() - start < 2
+    finally:
+        release.set()
+    assert started == []
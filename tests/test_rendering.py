@@ -0,0 +1,8 @@
+import pytest
+from src.rendering import render_many
+
+
+def test_svg_figures_are_refused(tmp_path):
+    # xelatex can't include svg without -shell-escape and inkscape.
+    with pytest.raises(ValueError):
+        render_many([("curve", {}, {}, str(tmp_path / "figure.svg"))], fmt="svg", cache_dir=str(tmp_path))
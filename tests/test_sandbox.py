@@ -0,0 +1,93 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src import sandbox as sandbox_module
+from src.sandbox import SandboxExecutor, pack_frame, unpack_frame, discard_frame
+
+needs_arrow = pytest.mark.skipif(sandbox_module.pa is None, reason="pyarrow is not available")
+
+
+@pytest.fixture(scope="module")
+def sandbox():
+    executor = SandboxExecutor(timeout=2, memory_mb=1024)
+    yield executor
+    executor.close()
+
+
+def shm_exists(payload):
+    return os.path.exists(os.path.join("/dev/shm", payload[1].lstrip("/")))
+
+
+@needs_arrow
+def test_frame_roundtrip_through_shared_memory():
+    df = pd.DataFrame({"t": np.arange(1000, dtype=float), "name": [f"点{i}" for i in range(1000)]}, index=np.arange(1000) * 2)
+    payload = pack_frame(df)
+    assert payload[0] == "arrow"
+    pd.testing.assert_frame_equal(unpack_frame(payload), df)
+    if os.path.isdir("/dev/shm"):
+        assert not shm_exists(payload)
+
+
+def test_frames_arrow_cant_hold_go_as_pickles():
+    df = pd.DataFrame({"mixed": [1, "a", 2.5, None, {"k": 1}]})
+    payload = pack_frame(df)
+    assert payload[0] == "pickle"
+    pd.testing.assert_frame_equal(unpack_frame(payload), df)
+
+
+@needs_arrow
+def test_discarded_frame_frees_its_block():
+    payload = pack_frame(pd.DataFrame({"x": [1.0, 2.0]}))
+    discard_frame(payload)
+    if os.path.isdir("/dev/shm"):
+        assert not shm_exists(payload)
+
+
+def test_changes_creations_and_deletions_come_back(sandbox):
+    dfs = {"data": pd.DataFrame({"x": [1.0, 2.0, 3.0]}), "old": pd.DataFrame({"y": [0]})}
+    error = sandbox.execute(
+        "dfs['data']['x2'] = dfs['data']['x'] ** 2\n"
+        "dfs['mean'] = pd.DataFrame({'m': [dfs['data']['x'].mean()]})\n"
+        "del dfs['old']",
+        dfs,
+    )
+    assert error is None
+    assert list(dfs) == ["data", "mean"]
+    assert dfs["data"]["x2"].tolist() == [1.0, 4.0, 9.0]
+    assert dfs["mean"]["m"].tolist() == [2.0]
+    # The worker keeps its copy: a query that only reads sends nothing and changes nothing.
+    assert sandbox.execute("total = dfs['data']['x2'].sum()", dfs) is None
+    assert dfs["data"]["x2"].tolist() == [1.0, 4.0, 9.0]
+
+
+def test_errors_of_the_query_are_returned(sandbox):
+    dfs = {"data": pd.DataFrame({"x": [1.0]})}
+    error = sandbox.execute("dfs['data']['missing']", dfs)
+    assert error.startswith("Exception occurs:") and "missing" in error
+
+
+def test_slow_query_is_killed_and_the_worker_restarted(sandbox):
+    dfs = {"data": pd.DataFrame({"x": [1.0]})}
+    error = sandbox.execute("import time\ndfs['data']['x'] = 2.0\ntime.sleep(30)", dfs)
+    assert "more than 2 seconds" in error
+    assert dfs["data"]["x"].tolist() == [1.0]
+    assert sandbox.execute("dfs['data']['x'] = dfs['data']['x'] + 1", dfs) is None
+    assert dfs["data"]["x"].tolist() == [2.0]
+
+
+def test_crashed_worker_is_restarted(sandbox):
+    dfs = {"data": pd.DataFrame({"x": [1.0]})}
+    error = sandbox.execute("import os\nos._exit(1)", dfs)
+    assert "crashed the worker" in error
+    assert sandbox.execute("dfs['data']['y'] = 1", dfs) is None
+    assert "y" in dfs["data"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="the memory limit needs resource.setrlimit")
+def test_memory_limit_stops_a_huge_allocation(sandbox):
+    dfs = {"data": pd.DataFrame({"x": [1.0]})}
+    error = sandbox.execute("big = np.ones(2 ** 31)", dfs)
+    assert "MemoryError" in error or "crashed the worker" in error
+    assert sandbox.execute("dfs['data']['z'] = 3", dfs) is None
+    assert dfs["data"]["z"].tolist() == [3]
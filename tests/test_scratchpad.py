@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+from src.chunking import estimate_tokens
+from src.scratchpad import compact_scratchpad, truncate_text
+
+
+def make_steps(count, observation="结果" * 200):
+    return [
+        (SimpleNamespace(tool="data_processor", tool_input=f"query {i}", log=f"Thought: step {i}\nAction: data_processor"), f"第 {i} 步\n{observation}")
+        for i in range(count)
+    ]
+
+
+def test_short_text_is_not_truncated():
+    assert truncate_text("abc", 10) == "abc"
+
+
+def test_long_text_keeps_both_ends():
+    text = "开头" + "x" * 4000 + "结尾"
+    truncated = truncate_text(text, 100)
+    assert truncated.startswith("开头") and truncated.endswith("结尾")
+    assert estimate_tokens(truncated) < estimate_tokens(text)
+
+
+def test_scratchpad_within_budget_is_kept_in_full():
+    steps = make_steps(2, observation="ok")
+    pad = compact_scratchpad(steps, max_tokens=10000)
+    assert pad == "".join(f"{action.log}\nObservation: {observation}\nThought: " for action, observation in steps)
+
+
+def test_old_steps_are_summarized_and_recent_ones_kept():
+    steps = make_steps(10)
+    pad = compact_scratchpad(steps, max_tokens=2000, observation_tokens=200, keep_recent=3)
+    assert pad.startswith("之前步骤的摘要：")
+    assert "- data_processor(query 0) -> 第 0 步" in pad
+    for i in range(7, 10):
+        assert f"Thought: step {i}" in pad
+    assert "Thought: step 0" not in pad
+
+
+def test_oldest_summaries_are_dropped_when_still_too_long():
+    steps = make_steps(40)
+    pad = compact_scratchpad(steps, max_tokens=600, observation_tokens=200, keep_recent=2)
+    assert "步已省略" in pad
+    assert "query 0)" not in pad
+    assert "Thought: step 39" in pad
@@ -0,0 +1,85 @@
+import json
+import threading
+from src.section_store import SectionWriter, read_index, read_section, build_index, store_paths
+
+
+def test_writer_and_reader_roundtrip(tmp_path):
+    with SectionWriter(str(tmp_path), "book") as writer:
+        writer.append("实验一", "第一节 $\\frac{1}{2}$")
+        writer.append("实验二", "第二节")
+        writer.append("实验一", "重复的标题")
+    index = read_index(str(tmp_path), "book")
+    assert list(index) == ["实验一", "实验二"]
+    assert read_section(str(tmp_path), "book", "实验一", index) == "第一节 $\\frac{1}{2}$"
+    assert read_section(str(tmp_path), "book", "实验二") == "第二节"
+    assert read_section(str(tmp_path), "book", "未知") == ""
+    jsonl_path, _ = store_paths(str(tmp_path), "book")
+    assert build_index(jsonl_path) == index
+
+
+def test_concurrent_first_access_converts_legacy_json_once(tmp_path):
+    sections = [{"title": f"实验{i}", "text": f"内容{i}" * 200} for i in range(50)]
+    for round in range(10):
+        books_dir = tmp_path / str(round)
+        books_dir.mkdir()
+        (books_dir / "book.json").write_text(json.dumps(sections, ensure_ascii=False), encoding="utf-8")
+        errors, texts = [], []
+
+        def read():
+            try:
+                texts.append(read_section(str(books_dir), "book", "实验49"))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert texts == ["内容49" * 200] * 4
+        assert sorted(path.name for path in books_dir.iterdir()) == ["book.index.json", "book.json", "book.jsonl"]
+
+
+def test_index_of_a_previous_version_of_the_book(tmp_path):
+    with SectionWriter(str(tmp_path), "book") as writer:
+        writer.append("实验一", "旧的第一节")
+        writer.append("实验二", "旧的第二节")
+    old_index = read_index(str(tmp_path), "book")
+    with SectionWriter(str(tmp_path), "book") as writer:
+        writer.append("实验一", "新的第一节，比原来长得多" * 10)
+        writer.append("实验二", "新的第二节")
+    assert read_section(str(tmp_path), "book", "实验二", old_index) == "新的第二节"
+    assert read_section(str(tmp_path), "book", "实验一", old_index) == "新的第一节，比原来长得多" * 10
+
+
+def test_reading_while_the_book_is_stored_again(tmp_path):
+    versions = [[(f"实验{i}", f"版本{v}的第{i}节" * (v + 1)) for i in range(20)] for v in range(3)]
+    expected = {title: {text for version in versions for t, text in version if t == title} for title, _ in versions[0]}
+    stop = threading.Event()
+    errors, texts = [], []
+
+    def write():
+        v = 0
+        while not stop.is_set():
+            with SectionWriter(str(tmp_path), "book") as writer:
+                for title, text in versions[v % 3]:
+                    writer.append(title, text)
+            v += 1
+
+    with SectionWriter(str(tmp_path), "book") as writer:
+        for title, text in versions[0]:
+            writer.append(title, text)
+    writer_thread = threading.Thread(target=write)
+    writer_thread.start()
+    try:
+        for _ in range(300):
+            try:
+                texts.append(read_section(str(tmp_path), "book", "实验7"))
+            except Exception as e:
+                errors.append(e)
+    finally:
+        stop.set()
+        writer_thread.join()
+    assert errors == []
+    assert set(texts) <= expected["实验7"]
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Only what the interface needs: every component is a context manager with a click method.
+GRADIO_STUB = '''
+class _Component:
+    def __init__(self, *args, **kwargs):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def click(self, *args, **kwargs):
+        pass
+    def route(self, *args, **kwargs):
+        return _Component()
+    def queue(self, *args, **kwargs):
+        return self
+    def launch(self, *args, **kwargs):
+        pass
+
+def __getattr__(name):
+    return _Component
+'''
+HEAVY_MODULES = ("pandas", "matplotlib", "langchain", "openai", "pdf2image")
+
+
+def run_script(tmp_path, script):
+    (tmp_path / "gradio.py").write_text(GRADIO_STUB, encoding="utf-8")
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(tmp_path), ROOT])}
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_server_starts_without_the_agent_dependencies(tmp_path):
+    script = (
+        "import sys, json\n"
+        "import src.main\n"
+        "src.main.build_demo()\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))\n"
+    )
+    assert run_script(tmp_path, script) == []
+
+
+def test_importing_the_server_module_builds_nothing(tmp_path):
+    # What the spawned sandbox and render workers do: import the module without running it.
+    script = (
+        "import sys, json\n"
+        "import src.main\n"
+        "print(json.dumps(['gradio' in sys.modules, src.main.job_queue is None]))\n"
+    )
+    assert run_script(tmp_path, script) == [False, True]
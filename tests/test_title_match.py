@@ -0,0 +1,35 @@
+from src.title_match import title_score, rank_titles, match_title
+
+TITLES = ["I-1 弹簧劲度系数的测量", "I-2 摩擦系数的测量", "II-2 粘弹性"]
+
+
+def test_identical_titles_score_one():
+    assert title_score("粘弹性", "粘弹性") == 1.0
+
+
+def test_numbering_and_punctuation_are_ignored():
+    assert title_score("粘弹性", "II-2 粘弹性") == 1.0
+    assert title_score("弹簧 劲度系数的测量！", "I-1 弹簧劲度系数的测量") == 1.0
+
+
+def test_contained_title_scores_above_unrelated_one():
+    assert title_score("摩擦系数", "I-2 摩擦系数的测量") > title_score("摩擦系数", "II-2 粘弹性")
+    assert rank_titles("摩擦系数", TITLES)[0][1] == "I-2 摩擦系数的测量"
+
+
+def test_empty_title_scores_zero():
+    assert title_score("", "粘弹性") == 0.0
+
+
+def test_match_title_prefers_exact_then_substring():
+    assert match_title("ii-2 粘弹性", TITLES) == "II-2 粘弹性"
+    assert match_title("摩擦系数", TITLES) == "I-2 摩擦系数的测量"
+
+
+def test_match_title_returns_nothing_for_an_empty_answer():
+    assert match_title("", TITLES) == ""
+    assert match_title("  。", TITLES) == ""
+
+
+def test_match_title_returns_nothing_for_an_unrelated_answer():
+    assert match_title("无法确定", TITLES) == ""